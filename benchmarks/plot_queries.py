@@ -0,0 +1,105 @@
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Callable, Tuple
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import select
+from sqlalchemy.sql.functions import func
+
+from monitor.database import ChiaEvent
+from monitor.database.events import HarvesterPlotsEvent
+from monitor.database.queries import configure_query_cache, get_plot_delta, get_plot_snapshots, sum_plots
+
+
+def create_database(path: str, harvesters: int, hours: int, interval_seconds: int) -> Session:
+    engine = create_engine(f"sqlite:///{path}")
+    ChiaEvent.metadata.create_all(engine)
+    now = datetime.now()
+    samples = hours * 3600 // interval_seconds
+    with Session(engine) as db_session:
+        for sample in range(samples):
+            ts = now - timedelta(seconds=(samples - sample) * interval_seconds)
+            db_session.execute(insert(HarvesterPlotsEvent), [{
+                "ts": ts,
+                "host": f"10.0.0.{host}",
+                "plot_count": 100 + host + sample * 10 // samples,
+                "portable_plot_count": 50,
+                "plot_size": (100 + host) * 108_000_000_000,
+                "portable_plot_size": 50 * 108_000_000_000,
+            } for host in range(harvesters)])
+        # Inserting takes a while, so the snapshots are shifted to end now again before they are measured
+        shift = round((datetime.now() - now).total_seconds() * 1000)
+        db_session.execute(text("UPDATE harvester_events SET ts = ts + :shift"), {"shift": shift})
+        db_session.commit()
+    return Session(engine)
+
+
+def legacy_plot_sum(db_session: Session, column) -> int:
+    sub_query = select(func.max(column).label("value")).where(
+        HarvesterPlotsEvent.ts > datetime.now() - timedelta(seconds=30)).group_by(HarvesterPlotsEvent.host).subquery()
+    return db_session.execute(select(func.sum(sub_query.c.value))).scalars().first()
+
+
+def legacy_plots(db_session: Session) -> Tuple[int, int, int, int]:
+    return (legacy_plot_sum(db_session, HarvesterPlotsEvent.plot_count),
+            legacy_plot_sum(db_session, HarvesterPlotsEvent.portable_plot_count),
+            legacy_plot_sum(db_session, HarvesterPlotsEvent.plot_size),
+            legacy_plot_sum(db_session, HarvesterPlotsEvent.portable_plot_size))
+
+
+def legacy_plot_delta(db_session: Session) -> Tuple[int, int]:
+    initial_ts = datetime.now() - timedelta(hours=24)
+    sub_query = select(HarvesterPlotsEvent.plot_count, HarvesterPlotsEvent.portable_plot_count,
+                       HarvesterPlotsEvent.plot_size,
+                       HarvesterPlotsEvent.portable_plot_size).where(HarvesterPlotsEvent.ts > initial_ts).order_by(
+                           HarvesterPlotsEvent.ts).group_by(HarvesterPlotsEvent.host).subquery()
+    initial = db_session.execute(
+        select(func.sum(sub_query.c.plot_count), func.sum(sub_query.c.portable_plot_count), func.sum(sub_query.c.plot_size),
+               func.sum(sub_query.c.portable_plot_size))).one()
+    # The summary computed the current plot count and size with the four queries each
+    current = legacy_plots(db_session)
+    legacy_plots(db_session)
+    return current[0] + current[1] - initial[0] - initial[1], current[2] + current[3] - initial[2] - initial[3]
+
+
+def benchmark(name: str, query: Callable, db_session: Session, repeat: int) -> None:
+    result = query(db_session)
+    start = perf_counter()
+    for _ in range(repeat):
+        query(db_session)
+    elapsed = (perf_counter() - start) / repeat
+    print(f"{name:<40} {elapsed * 1000:8.2f} ms  {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the plot queries on a synthetic multi-harvester database")
+    parser.add_argument("--harvesters", type=int, default=50)
+    parser.add_argument("--hours", type=int, default=48)
+    parser.add_argument("--interval-seconds", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Measure the queries themselves rather than hits of the query cache
+    configure_query_cache(0)
+    # The legacy queries ran without the (host, ts) index, which slows down their grouped scans considerably
+    for legacy in [True, False]:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.sqlite")
+            db_session = create_database(path, args.harvesters, args.hours, args.interval_seconds)
+            if legacy:
+                db_session.execute(text("DROP INDEX ix_harvester_events_host_ts"))
+            rows = db_session.execute(select(func.count(HarvesterPlotsEvent.id))).scalars().first()
+            schema = "legacy schema" if legacy else "(host, ts) index"
+            print(f"{rows} harvester events from {args.harvesters} harvesters over {args.hours}h with {schema}")
+            if legacy:
+                benchmark("legacy plot counts and sizes (4 queries)", legacy_plots, db_session, args.repeat)
+                benchmark("legacy plot delta", legacy_plot_delta, db_session, args.repeat)
+            else:
+                benchmark("plot snapshots", lambda db_session: sum_plots(get_plot_snapshots(db_session)), db_session,
+                          args.repeat)
+                benchmark("plot delta", get_plot_delta, db_session, args.repeat)
+            db_session.close()
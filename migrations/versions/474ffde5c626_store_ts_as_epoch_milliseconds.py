@@ -0,0 +1,55 @@
+"""Store ts of all event tables as epoch milliseconds
+
+Revision ID: 474ffde5c626
+Revises: 49afdfda9293
+Create Date: 2026-10-18 12:26:08.913402
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from monitor.database.migration import rebuild_table
+from monitor.database.types import datetime_to_millis, millis_to_datetime
+
+
+# revision identifiers, used by Alembic.
+revision = '474ffde5c626'
+down_revision = '49afdfda9293'
+branch_labels = None
+depends_on = None
+
+TABLES = [
+    'blockchain_state_events',
+    'connection_events',
+    'farming_info_events',
+    'harvester_events',
+    'pool_state_events',
+    'price_events',
+    'signage_point_events',
+    'wallet_balance_events',
+]
+
+
+def rebuild_ts(name, ts_type, convert_ts):
+    inspector = sa.inspect(op.get_bind())
+    columns = [
+        sa.Column(column['name'], ts_type if column['name'] == 'ts' else column['type'], nullable=column['nullable'])
+        for column in inspector.get_columns(name)
+    ]
+    indexes = [index['column_names'][0] for index in inspector.get_indexes(name)]
+
+    def convert(row):
+        row['ts'] = convert_ts(row['ts'])
+        return row
+
+    rebuild_table(name, columns, indexes, convert)
+
+
+def upgrade():
+    for name in TABLES:
+        rebuild_ts(name, sa.BigInteger(), datetime_to_millis)
+
+
+def downgrade():
+    for name in TABLES:
+        rebuild_ts(name, sa.DateTime(), millis_to_datetime)
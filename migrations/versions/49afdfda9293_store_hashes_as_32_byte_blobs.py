@@ -0,0 +1,63 @@
+"""Store challenge_hash and signage_point as 32-byte blobs
+
+Revision ID: 49afdfda9293
+Revises: 9370a928536d
+Create Date: 2026-10-18 11:03:54.217630
+
+"""
+import sqlalchemy as sa
+
+from monitor.database.migration import rebuild_table
+from monitor.database.types import bytes_to_hash, hash_to_bytes
+
+
+# revision identifiers, used by Alembic.
+revision = '49afdfda9293'
+down_revision = '9370a928536d'
+branch_labels = None
+depends_on = None
+
+INDEXES = ['ts', 'challenge_hash', 'signage_point']
+
+
+def convert(row, convert_hash):
+    for column in ['challenge_hash', 'signage_point']:
+        if row[column] is not None:
+            row[column] = convert_hash(row[column])
+    return row
+
+
+def farming_info_columns(hash_type):
+    return [
+        sa.Column('ts', sa.DateTime(), nullable=False),
+        sa.Column('challenge_hash', hash_type, nullable=True),
+        sa.Column('signage_point', hash_type, nullable=True),
+        sa.Column('passed_filter', sa.Integer(), nullable=True),
+        sa.Column('proofs', sa.Integer(), nullable=True),
+        sa.Column('total_plots', sa.Integer(), nullable=True),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    ]
+
+
+def signage_point_columns(hash_type):
+    return [
+        sa.Column('ts', sa.DateTime(), nullable=False),
+        sa.Column('challenge_hash', hash_type, nullable=True),
+        sa.Column('signage_point', hash_type, nullable=True),
+        sa.Column('signage_point_index', sa.Integer(), nullable=True),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    ]
+
+
+def upgrade():
+    rebuild_table('farming_info_events', farming_info_columns(sa.LargeBinary(length=32)), INDEXES,
+                  lambda row: convert(row, hash_to_bytes))
+    rebuild_table('signage_point_events', signage_point_columns(sa.LargeBinary(length=32)), INDEXES,
+                  lambda row: convert(row, hash_to_bytes))
+
+
+def downgrade():
+    rebuild_table('signage_point_events', signage_point_columns(sa.String(length=66)), INDEXES,
+                  lambda row: convert(row, bytes_to_hash))
+    rebuild_table('farming_info_events', farming_info_columns(sa.String(length=66)), INDEXES,
+                  lambda row: convert(row, bytes_to_hash))
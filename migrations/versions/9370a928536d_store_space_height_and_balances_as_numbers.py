@@ -0,0 +1,70 @@
+"""Store space, peak_height and wallet balances as numbers
+
+Revision ID: 9370a928536d
+Revises: da29916875ec
+Create Date: 2026-10-18 10:12:31.482913
+
+"""
+import sqlalchemy as sa
+
+from monitor.database.migration import rebuild_table
+
+# revision identifiers, used by Alembic.
+revision = '9370a928536d'
+down_revision = 'da29916875ec'
+branch_labels = None
+depends_on = None
+
+
+def convert(row, types):
+    for column, type_ in types.items():
+        if row[column] is not None:
+            row[column] = type_(row[column])
+    return row
+
+
+def blockchain_state_columns(space_type, peak_height_type):
+    return [
+        sa.Column('ts', sa.DateTime(), nullable=False),
+        sa.Column('space', space_type, nullable=True),
+        sa.Column('diffculty', sa.Integer(), nullable=True),
+        sa.Column('peak_height', peak_height_type, nullable=True),
+        sa.Column('synced', sa.Boolean(), nullable=True),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('mempool_size', sa.Integer(), nullable=True),
+    ]
+
+
+def wallet_balance_columns(balance_type):
+    return [
+        sa.Column('ts', sa.DateTime(), nullable=False),
+        sa.Column('confirmed', balance_type, nullable=True),
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('farmed', balance_type, nullable=True),
+    ]
+
+
+def upgrade():
+    rebuild_table('blockchain_state_events', blockchain_state_columns(sa.Float(), sa.BigInteger()), ['ts'],
+                  lambda row: convert(row, {
+                      'space': float,
+                      'peak_height': int
+                  }))
+    rebuild_table('wallet_balance_events', wallet_balance_columns(sa.BigInteger()), ['ts'],
+                  lambda row: convert(row, {
+                      'confirmed': int,
+                      'farmed': int
+                  }))
+
+
+def downgrade():
+    rebuild_table('wallet_balance_events', wallet_balance_columns(sa.String(length=32)), ['ts'],
+                  lambda row: convert(row, {
+                      'confirmed': str,
+                      'farmed': str
+                  }))
+    rebuild_table('blockchain_state_events', blockchain_state_columns(sa.String(length=32), sa.String(length=32)), ['ts'],
+                  lambda row: convert(row, {
+                      'space': lambda space: str(int(space)),
+                      'peak_height': str
+                  }))
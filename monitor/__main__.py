@@ -2,8 +2,7 @@ import asyncio
 import json
 import logging
 import sys
-from asyncio.queues import Queue
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import colorlog
 from chia.util.config import load_config
@@ -12,10 +11,18 @@ from sqlalchemy.exc import OperationalError
 
 from monitor.collectors import RpcCollector, WsCollector
 from monitor.collectors.price_collector import PriceCollector
-from monitor.database import ChiaEvent, session
+from monitor.database import check_pragmas, configure_engine, session
+from monitor.database.queries import (configure_query_cache, configure_snapshot_max_age, get_recent_signage_points)
+from monitor.enricher import Enricher
 from monitor.exporter import ChiaExporter
 from monitor.logger import ChiaLogger
 from monitor.notifier import Notifier
+from monitor.pipeline import CoalescingQueue, OverflowPolicy, Pipeline, Sink
+from monitor.rollup import RollupJob
+from monitor.server import HttpServer
+from monitor.sketch import LookupTimeWindows
+from monitor.state import LatestState
+from monitor.writer import DatabaseWriter
 
 chia_config = load_config(DEFAULT_ROOT_PATH, "config.yaml")
 
@@ -34,22 +41,42 @@ def initilize_logging():
     logger.setLevel(logging.INFO)
 
 
-def persist_event(event: ChiaEvent):
-    with session.begin() as db_session:
-        db_session.add(event)
-        db_session.commit()
-
-
-async def aggregator(exporter: ChiaExporter, notifier: Optional[Notifier], rpc_refresh_interval: int,
-                     price_refresh_interval: int) -> None:
+async def aggregator(exporter: ChiaExporter, state: LatestState, notifier: Optional[Notifier], rollup_job: RollupJob,
+                     exporter_port: int, rpc_refresh_interval: int, rpc_task_intervals: Dict[str, int], rpc_jitter: float,
+                     rpc_timeout: float, rpc_max_interval: Optional[int], rpc_backoff_factor: float,
+                     rpc_signage_point_tasks: List[str], wallet_list_refresh_interval: int, wallet_concurrency: int,
+                     remote_harvesters: List[Dict], harvester_timeout: float, price_refresh_interval: int,
+                     db_batch_size: int, db_flush_interval: float, db_heartbeat_interval: int, event_queue_size: int,
+                     sink_configs: Dict[str, Tuple[int, OverflowPolicy]]) -> None:
     rpc_collector = None
     ws_collector = None
-    event_queue = Queue()
+    price_collector = None
+    event_queue = CoalescingQueue("aggregator", event_queue_size)
     logger = ChiaLogger()
+    enricher = Enricher()
+    try:
+        with session() as db_session:
+            enricher.index.load(get_recent_signage_points(db_session, enricher.index.max_size))
+            state.load(db_session)
+    except OperationalError as e:
+        logging.warning(f"Failed to load recent events from DB. {type(e).__name__}: {e}")
+    writer = DatabaseWriter(*sink_configs["database"], db_batch_size, db_flush_interval, db_heartbeat_interval)
+    sinks = [
+        Sink("exporter", exporter.process_event, *sink_configs["exporter"]),
+        Sink("logger", logger.process_event, *sink_configs["logger"]),
+        writer,
+    ]
+    pipeline = Pipeline(event_queue, [enricher.process_event, state.process_event], sinks)
+    server = HttpServer(exporter, exporter_port)
+    await server.start()
 
     try:
         logging.info("🔌 Creating RPC Collector...")
-        rpc_collector = await RpcCollector.create(DEFAULT_ROOT_PATH, chia_config, event_queue, rpc_refresh_interval)
+        rpc_collector = await RpcCollector.create(DEFAULT_ROOT_PATH, chia_config, event_queue, rpc_refresh_interval,
+                                                  rpc_task_intervals, rpc_jitter, rpc_timeout, rpc_max_interval,
+                                                  rpc_backoff_factor, rpc_signage_point_tasks, wallet_list_refresh_interval,
+                                                  wallet_concurrency, remote_harvesters, harvester_timeout)
+        pipeline.stages.append(rpc_collector.process_event)
     except Exception as e:
         logging.warning(f"Failed to create RPC collector. Continuing without it. {type(e).__name__}: {e}")
 
@@ -71,22 +98,16 @@ async def aggregator(exporter: ChiaExporter, notifier: Optional[Notifier], rpc_r
         ws_task = asyncio.create_task(ws_collector.task())
         if notifier is not None:
             notifier.start()
+        rollup_job.start()
         if price_collector is not None:
             asyncio.create_task(price_collector.task())
-        while True:
-            try:
-                event = await event_queue.get()
-                exporter.process_event(event)
-                logger.process_event(event)
-                persist_event(event)
-
-            except OperationalError:
-                logging.exception(
-                    f"Failed to persist event to DB. Please initialize DB using: 'pipenv run alembic upgrade head'")
-                break
-
-            except asyncio.CancelledError:
-                break
+        try:
+            await pipeline.run()
+        except OperationalError:
+            logging.exception(
+                f"Failed to persist event to DB. Please initialize DB using: 'pipenv run alembic upgrade head'")
+        except asyncio.CancelledError:
+            pass
 
     else:
         logging.error("Failed to create any collector.")
@@ -98,8 +119,11 @@ async def aggregator(exporter: ChiaExporter, notifier: Optional[Notifier], rpc_r
     if ws_collector:
         ws_task.cancel()
         await ws_collector.close()
+    await writer.close()
+    await server.close()
     if notifier:
         notifier.stop()
+    rollup_job.stop()
 
 
 def read_config():
@@ -120,7 +144,20 @@ if __name__ == "__main__":
 
     try:
         exporter_port = config["exporter_port"]
+        series_ttl_seconds = config["exporter"]["series_ttl_seconds"]
+        max_series = config["exporter"]["max_series"]
+        lookup_time_windows_minutes = config["exporter"]["lookup_time_windows_minutes"]
         rpc_refresh_interval = config["rpc_collector"]["refresh_interval_seconds"]
+        rpc_task_intervals = config["rpc_collector"]["task_intervals_seconds"]
+        rpc_jitter = config["rpc_collector"]["jitter_seconds"]
+        rpc_timeout = config["rpc_collector"]["timeout_seconds"]
+        rpc_max_interval = config["rpc_collector"]["max_interval_seconds"]
+        rpc_backoff_factor = config["rpc_collector"]["backoff_factor"]
+        rpc_signage_point_tasks = config["rpc_collector"]["signage_point_tasks"]
+        wallet_list_refresh_interval = config["rpc_collector"]["wallet_list_refresh_interval_seconds"]
+        wallet_concurrency = config["rpc_collector"]["wallet_concurrency"]
+        remote_harvesters = config["rpc_collector"]["remote_harvesters"]
+        harvester_timeout = config["rpc_collector"]["harvester_timeout_seconds"]
         price_refresh_interval = enable_notifications = config["price_collector"]["refresh_interval_seconds"]
         enable_notifications = config["notifications"]["enable"]
         notifications_refresh_interval = config["notifications"]["refresh_interval_seconds"]
@@ -129,20 +166,59 @@ if __name__ == "__main__":
         status_interval_minutes = config["notifications"]["status_interval_minutes"]
         lost_plots_alert_threshold = config["notifications"]["lost_plots_alert_threshold"]
         disable_proof_found_alert = config["notifications"]["disable_proof_found_alert"]
+        db_url = config["database"]["url"]
+        db_pool_size = config["database"]["pool_size"]
+        db_pragmas = config["database"]["sqlite_pragmas"]
+        db_batch_size = config["database"]["batch_size"]
+        db_flush_interval = config["database"]["flush_interval_seconds"]
+        db_heartbeat_interval = config["database"]["heartbeat_interval_seconds"]
+        db_query_cache_size = config["database"]["query_cache_size"]
+        rollup_refresh_interval = config["rollup"]["refresh_interval_seconds"]
+        raw_retention_days = config["rollup"]["raw_retention_days"]
+        minute_retention_days = config["rollup"]["minute_retention_days"]
+        event_queue_size = config["event_queue_size"]
+        sink_configs = {
+            name: (config["sinks"][name]["queue_size"], OverflowPolicy(config["sinks"][name]["overflow_policy"]))
+            for name in ["exporter", "logger", "database"]
+        }
     except KeyError as ex:
         logging.error(
             f"Failed to validate config. Missing required key {ex}. Please compare the fields of your config.json with the config-example.json and fix all inconsistencies."
         )
         sys.exit(1)
+    except ValueError as ex:
+        logging.error(f"Failed to validate config. {ex}. Supported overflow policies are: block, drop_oldest, coalesce")
+        sys.exit(1)
+
+    configure_engine(db_url, db_pool_size, db_pragmas)
+    rpc_intervals = [rpc_refresh_interval, *rpc_task_intervals.values()]
+    if rpc_max_interval is not None:
+        rpc_intervals.append(rpc_max_interval)
+    # Longest time between two polls of a task, including the backoff, the jitter and a poll that runs into its timeout
+    rpc_poll_interval = max(rpc_intervals) + rpc_jitter + rpc_timeout
+    configure_snapshot_max_age(db_heartbeat_interval, rpc_poll_interval)
+    configure_query_cache(db_query_cache_size)
+    try:
+        check_pragmas(db_pragmas)
+    except OperationalError as e:
+        logging.warning(f"Failed to check database settings. {type(e).__name__}: {e}")
 
-    exporter = ChiaExporter(exporter_port)
+    lookup_time_windows = LookupTimeWindows(lookup_time_windows_minutes)
+    exporter = ChiaExporter(series_ttl_seconds, max_series, lookup_time_windows)
+    state = LatestState(rpc_poll_interval)
     if enable_notifications:
         notifier = Notifier(status_url, alert_url, status_interval_minutes, lost_plots_alert_threshold,
-                            disable_proof_found_alert, notifications_refresh_interval)
+                            disable_proof_found_alert, notifications_refresh_interval, lookup_time_windows, state)
     else:
         notifier = None
+    rollup_job = RollupJob(rollup_refresh_interval, raw_retention_days, minute_retention_days)
 
     try:
-        asyncio.run(aggregator(exporter, notifier, rpc_refresh_interval, price_refresh_interval))
+        asyncio.run(
+            aggregator(exporter, state, notifier, rollup_job, exporter_port, rpc_refresh_interval, rpc_task_intervals,
+                       rpc_jitter, rpc_timeout, rpc_max_interval, rpc_backoff_factor, rpc_signage_point_tasks,
+                       wallet_list_refresh_interval, wallet_concurrency, remote_harvesters, harvester_timeout,
+                       price_refresh_interval, db_batch_size, db_flush_interval, db_heartbeat_interval, event_queue_size,
+                       sink_configs))
     except KeyboardInterrupt:
         logging.info("👋 Bye!")
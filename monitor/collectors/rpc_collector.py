@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import logging
+import random
 import time
 from asyncio import Queue
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict, List
+from time import monotonic, perf_counter
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Type
 
 from chia.rpc.farmer_rpc_client import FarmerRpcClient
 from chia.rpc.full_node_rpc_client import FullNodeRpcClient
@@ -15,10 +18,74 @@ from chia.rpc.harvester_rpc_client import HarvesterRpcClient
 from chia.rpc.rpc_client import RpcClient
 from chia.rpc.wallet_rpc_client import WalletRpcClient
 from chia.server.outbound_message import NodeType
-from chia.util.ints import uint16
+from chia.util.ints import uint16, uint32
 from monitor.collectors.collector import Collector
-from monitor.database.events import (BlockchainStateEvent, ChiaEvent, ConnectionsEvent,
-                                     HarvesterPlotsEvent, PoolStateEvent, WalletBalanceEvent)
+from monitor.database.events import (BlockchainStateEvent, ChiaEvent, ConnectionsEvent, HarvesterPlotsEvent, PoolStateEvent,
+                                     SignagePointEvent, WalletBalanceEvent, WalletEvent)
+from monitor.exporter import ChiaExporter
+from monitor.pipeline import snapshot_key, snapshot_values
+
+try:
+    from chia.rpc.farmer_rpc_api import PlotInfoRequestData
+    from chia.types.blockchain_format.sized_bytes import bytes32
+except ImportError:
+    # Farmers before 1.3 only serve the full plot lists
+    PlotInfoRequestData = None
+
+PLOT_PAGE_SIZE = 1000
+# A harvester's plots are only fetched again when one of these summary fields changed
+HARVESTER_SUMMARY_KEYS = [
+    "plots", "total_plot_size", "failed_to_open_filenames", "no_key_filenames", "duplicates", "syncing"
+]
+
+# OG plot count, OG plot size, portable plot count and portable plot size
+PlotTotals = Tuple[int, int, int, int]
+# Host, plot totals and the number of plots that failed to open or have no known key
+HarvesterPlots = Tuple[str, PlotTotals, Optional[int], Optional[int]]
+
+
+def sum_plots(plots: Iterable[Dict], totals: PlotTotals = (0, 0, 0, 0)) -> PlotTotals:
+    og_plot_count, og_plot_size, portable_plot_count, portable_plot_size = totals
+    for plot in plots:
+        if plot["pool_contract_puzzle_hash"] is None:
+            og_plot_count += 1
+            og_plot_size += plot["file_size"]
+        else:
+            portable_plot_count += 1
+            portable_plot_size += plot["file_size"]
+    return og_plot_count, og_plot_size, portable_plot_count, portable_plot_size
+
+
+def decode_changed(body: bytes, previous_digest: Optional[bytes]) -> Tuple[bytes, Optional[Dict]]:
+    digest = hashlib.sha256(body).digest()
+    if digest == previous_digest:
+        return digest, None
+    response = json.loads(body)
+    if not response.get("success", False):
+        raise ValueError(response)
+    return digest, response
+
+
+def harvester_plots(host: str, harvester: Dict, no_key_field: str) -> HarvesterPlots:
+    failed_plot_count = len(harvester.get("failed_to_open_filenames", []))
+    no_key_plot_count = len(harvester.get(no_key_field, []))
+    return host, sum_plots(harvester["plots"]), failed_plot_count, no_key_plot_count
+
+
+def reduce_harvester_lists(body: bytes, previous_digest: Optional[bytes]) -> Tuple[bytes, Optional[List[HarvesterPlots]]]:
+    digest, response = decode_changed(body, previous_digest)
+    if response is None:
+        return digest, None
+    return digest, [
+        harvester_plots(harvester["connection"]["host"], harvester, "no_key_filenames")
+        for harvester in response["harvesters"]
+    ]
+
+
+def reduce_plot_list(host: str, body: bytes, previous_digest: Optional[bytes]) -> Tuple[bytes, Optional[HarvesterPlots]]:
+    digest, response = decode_changed(body, previous_digest)
+    # Harvesters list the plots without a known key as not found
+    return digest, None if response is None else harvester_plots(host, response, "not_found_filenames")
 
 
 class RpcCollector(Collector):
@@ -31,10 +98,37 @@ class RpcCollector(Collector):
     hostname: str
     tasks: List[Callable]
     refresh_interval_seconds: int
+    # Intervals of tasks that are not polled every refresh_interval_seconds, by task name
+    task_intervals: Dict[str, int]
+    jitter_seconds: float
+    timeout_seconds: float
+    # Intervals of unchanged tasks grow by the backoff factor up to the max interval, if set
+    max_interval_seconds: Optional[int]
+    backoff_factor: float
+    signage_point_tasks: List[str]
+    triggers: Dict[str, asyncio.Event]
+    published: Dict[Tuple[Type[ChiaEvent], Hashable], Tuple]
+    harvester_hosts: List[str]
+    # The wallet list rarely changes, so it is only fetched again after this long or when a wallet failed
+    wallet_list_refresh_seconds: int
+    wallets: Optional[List[Dict]]
+    wallets_ts: float
+    wallet_semaphore: asyncio.Semaphore
+    # Plot totals of the last poll by harvester node id, with the summary they were fetched for
+    harvester_plot_totals: Dict[str, Tuple[Tuple, PlotTotals]]
+    harvester_lists_digest: Optional[bytes]
+    harvester_lists: List[HarvesterPlots]
+    # Remote harvesters polled directly instead of through the farmer, in the order of harvester_clients
+    remote_harvester_hosts: List[str]
+    remote_harvester_plots: Dict[str, Tuple[bytes, HarvesterPlots]]
+    harvester_timeout_seconds: float
 
     @staticmethod
-    async def create(root_path: Path, net_config: Dict, event_queue: Queue[ChiaEvent],
-                     refresh_interval_seconds: int) -> RpcCollector:
+    async def create(root_path: Path, net_config: Dict, event_queue: Queue[ChiaEvent], refresh_interval_seconds: int,
+                     task_intervals: Dict[str, int], jitter_seconds: float, timeout_seconds: float,
+                     max_interval_seconds: Optional[int], backoff_factor: float, signage_point_tasks: List[str],
+                     wallet_list_refresh_seconds: int, wallet_concurrency: int, remote_harvesters: List[Dict],
+                     harvester_timeout_seconds: float) -> RpcCollector:
         self = RpcCollector()
         self.log = logging.getLogger(__name__)
         self.event_queue = event_queue
@@ -45,6 +139,24 @@ class RpcCollector(Collector):
         self.tasks = []
         self.harvester_clients = []
         self.refresh_interval_seconds = refresh_interval_seconds
+        self.task_intervals = task_intervals
+        self.jitter_seconds = jitter_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.backoff_factor = backoff_factor
+        self.signage_point_tasks = signage_point_tasks
+        self.published = {}
+        self.harvester_hosts = []
+        self.wallet_list_refresh_seconds = wallet_list_refresh_seconds
+        self.wallets = None
+        self.wallets_ts = 0.0
+        self.wallet_semaphore = asyncio.Semaphore(wallet_concurrency)
+        self.harvester_plot_totals = {}
+        self.harvester_lists_digest = None
+        self.harvester_lists = []
+        self.remote_harvester_hosts = []
+        self.remote_harvester_plots = {}
+        self.harvester_timeout_seconds = harvester_timeout_seconds
 
         try:
             full_node_rpc_port = net_config["full_node"]["rpc_port"]
@@ -76,12 +188,28 @@ class RpcCollector(Collector):
                 f"Failed to connect to wallet RPC endpoint. Continuing without it. {type(e).__name__}: {e}"
             )
 
+        for harvester in remote_harvesters:
+            try:
+                harvester_rpc_port = harvester.get("port", net_config["harvester"]["rpc_port"])
+                harvester_client = await HarvesterRpcClient.create(harvester["host"], uint16(harvester_rpc_port),
+                                                                   self.root_path, self.net_config)
+                self.harvester_clients.append(harvester_client)
+                self.remote_harvester_hosts.append(harvester["host"])
+            except Exception as e:
+                self.log.warning(f"Failed to create RPC client for harvester {harvester['host']}. "
+                                 f"Continuing without it. {type(e).__name__}: {e}")
+        if len(self.harvester_clients) > 0:
+            self.tasks.append(self.get_harvester_plots)
+        elif len(remote_harvesters) > 0:
+            self.log.warning("Failed to create RPC clients for all remote harvesters. Collecting harvesters via the farmer")
+
         try:
             farming_rpc_port = net_config["farmer"]["rpc_port"]
             self.farmer_client = await FarmerRpcClient.create(self.hostname, uint16(farming_rpc_port),
                                                               self.root_path, self.net_config)
             await self.farmer_client.get_connections()
-            self.tasks.append(self.get_harvester_plots)
+            if len(self.harvester_clients) == 0:
+                self.tasks.append(self.get_harvester_plots)
             self.tasks.append(self.get_pool_state)
         except Exception as e:
             if self.farmer_client is not None:
@@ -95,49 +223,166 @@ class RpcCollector(Collector):
             raise ConnectionError(
                 "Failed to connect to any RPC endpoints, Check if your Chia services are running")
 
+        self.triggers = {task.__name__: asyncio.Event() for task in self.tasks}
         return self
 
-    async def get_wallet_balance(self) -> None:
+    async def publish_event(self, event: ChiaEvent) -> bool:
+        # Returns whether the snapshot changed since it was last published
+        key = snapshot_key(event)
+        values = snapshot_values(event)
+        changed = self.published.get(key) != values
+        self.published[key] = values
+        await super().publish_event(event)
+        return changed
+
+    def process_event(self, event: ChiaEvent) -> None:
+        if isinstance(event, SignagePointEvent):
+            for name in self.signage_point_tasks:
+                if name in self.triggers:
+                    self.triggers[name].set()
+
+    async def get_wallets(self) -> List[Dict]:
+        if self.wallets is None or monotonic() - self.wallets_ts > self.wallet_list_refresh_seconds:
+            self.wallets = await self.wallet_client.get_wallets()
+            self.wallets_ts = monotonic()
+        return self.wallets
+
+    async def get_wallet(self, wallet_id: int) -> Dict:
+        async with self.wallet_semaphore:
+            return await self.wallet_client.get_wallet_balance(wallet_id)
+
+    async def get_wallet_balance(self) -> bool:
         try:
-            wallets = await self.wallet_client.get_wallets()
-            farmed_amount = await self.wallet_client.get_farmed_amount()
-            confirmed_balances = []
-            for wallet in wallets:
-                balance = await self.wallet_client.get_wallet_balance(wallet["id"])
-                confirmed_balances.append(balance["confirmed_wallet_balance"])
+            wallets = await self.get_wallets()
+            farmed_amount, *balances = await asyncio.gather(self.wallet_client.get_farmed_amount(),
+                                                            *[self.get_wallet(wallet["id"]) for wallet in wallets])
         except Exception as e:
+            self.wallets = None
             raise ConnectionError(
                 f"Failed to get wallet balance via RPC. Is your wallet running? {type(e).__name__}: {e}")
-        event = WalletBalanceEvent(ts=datetime.now(),
-                                   confirmed=str(sum(confirmed_balances)),
-                                   farmed=str(farmed_amount['farmed_amount']))
-        await self.publish_event(event)
+        ts = datetime.now()
+        changed = False
+        for wallet, balance in zip(wallets, balances):
+            event = WalletEvent(ts=ts,
+                                wallet_id=wallet["id"],
+                                name=wallet["name"],
+                                type=wallet["type"],
+                                confirmed=balance["confirmed_wallet_balance"],
+                                spendable=balance["spendable_balance"])
+            changed = await self.publish_event(event) or changed
+        event = WalletBalanceEvent(ts=ts,
+                                   confirmed=sum(balance["confirmed_wallet_balance"] for balance in balances),
+                                   farmed=farmed_amount['farmed_amount'])
+        return await self.publish_event(event) or changed
+
+    async def get_harvester_plot_totals(self, node_id: str) -> PlotTotals:
+        totals = (0, 0, 0, 0)
+        page, page_count = 0, 1
+        while page < page_count:
+            request = PlotInfoRequestData(bytes32.from_hexstr(node_id), uint32(page), uint32(PLOT_PAGE_SIZE))
+            response = await self.farmer_client.get_harvester_plots_valid(request)
+            totals = sum_plots(response["plots"], totals)
+            page_count = response["page_count"]
+            page += 1
+        return totals
+
+    async def get_harvester_summaries(self) -> List[HarvesterPlots]:
+        summaries = await self.farmer_client.get_harvesters_summary()
+        harvesters = []
+        harvester_plot_totals = {}
+        for summary in summaries["harvesters"]:
+            node_id = summary["connection"]["node_id"]
+            summary_values = tuple(summary.get(key) for key in HARVESTER_SUMMARY_KEYS)
+            cached = self.harvester_plot_totals.get(node_id)
+            if cached is not None and cached[0] == summary_values:
+                ChiaExporter.unchanged_harvesters_counter.inc()
+            else:
+                cached = summary_values, await self.get_harvester_plot_totals(node_id)
+            harvester_plot_totals[node_id] = cached
+            harvesters.append((summary["connection"]["host"], cached[1], summary.get("failed_to_open_filenames"),
+                               summary.get("no_key_filenames")))
+        self.harvester_plot_totals = harvester_plot_totals
+        return harvesters
+
+    @staticmethod
+    async def fetch_raw(client: RpcClient, path: str) -> bytes:
+        # Plot lists can be tens of MB, so they are read as bytes and decoded off the event loop
+        async with client.session.post(f"{client.url}{path}", json={}, ssl=client.ssl_context) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def get_harvester_lists(self) -> List[HarvesterPlots]:
+        body = await RpcCollector.fetch_raw(self.farmer_client, "get_harvesters")
+        digest, harvesters = await asyncio.get_running_loop().run_in_executor(None, reduce_harvester_lists, body,
+                                                                              self.harvester_lists_digest)
+        if harvesters is None:
+            ChiaExporter.unchanged_harvesters_counter.inc(len(self.harvester_lists))
+            return self.harvester_lists
+        self.harvester_lists_digest = digest
+        self.harvester_lists = harvesters
+        return harvesters
 
-    async def get_harvester_plots(self) -> None:
+    async def get_remote_harvester(self, host: str, client: HarvesterRpcClient) -> Optional[HarvesterPlots]:
+        previous_digest, previous_plots = self.remote_harvester_plots.get(host, (None, None))
+        start = perf_counter()
         try:
-            harvesters = await self.farmer_client.get_harvesters()
-            ts = datetime.now()
-            for harvester in harvesters["harvesters"]:
-                host = harvester["connection"]["host"]
-                plots = harvester["plots"]
-                og_plots = [plot for plot in plots if plot["pool_contract_puzzle_hash"] is None]
-                portable_plots = [
-                    plot for plot in plots if plot["pool_contract_puzzle_hash"] is not None
-                ]
-                event = HarvesterPlotsEvent(ts=ts,
-                                            plot_count=len(og_plots),
-                                            plot_size=sum(og_plot["file_size"] for og_plot in og_plots),
-                                            portable_plot_count=len(portable_plots),
-                                            portable_plot_size=sum(portable_plot["file_size"]
-                                                                   for portable_plot in portable_plots),
-                                            host=host)
-                await self.publish_event(event)
-        except:
-            raise ConnectionError("Failed to get harvesters via RPC. Is your farmer running?")
+            body = await asyncio.wait_for(RpcCollector.fetch_raw(client, "get_plots"), self.harvester_timeout_seconds)
+            digest, plots = await asyncio.get_running_loop().run_in_executor(None, reduce_plot_list, host, body,
+                                                                             previous_digest)
+        except Exception as e:
+            ChiaExporter.harvester_rpc_errors_counter.labels(host).inc()
+            self.log.warning(f"Failed to get plots of harvester {host}. {type(e).__name__}: {e}")
+            return None
+        finally:
+            ChiaExporter.harvester_rpc_time.labels(host).observe(perf_counter() - start)
+        if plots is None:
+            ChiaExporter.unchanged_harvesters_counter.inc()
+            return previous_plots
+        self.remote_harvester_plots[host] = digest, plots
+        return plots
+
+    async def get_remote_harvesters(self) -> List[HarvesterPlots]:
+        # Harvesters are polled concurrently, so an unreachable one only misses this poll after its timeout
+        results = await asyncio.gather(*[
+            self.get_remote_harvester(host, client)
+            for host, client in zip(self.remote_harvester_hosts, self.harvester_clients)
+        ])
+        harvesters = [harvester for harvester in results if harvester is not None]
+        if len(harvesters) == 0:
+            raise ConnectionError("Failed to reach any of the remote harvesters")
+        return harvesters
 
-    async def get_pool_state(self) -> None:
+    async def get_harvester_plots(self) -> bool:
+        try:
+            if len(self.harvester_clients) > 0:
+                harvesters = await self.get_remote_harvesters()
+            elif PlotInfoRequestData is not None and hasattr(self.farmer_client, "get_harvesters_summary"):
+                harvesters = await self.get_harvester_summaries()
+            else:
+                harvesters = await self.get_harvester_lists()
+        except Exception as e:
+            raise ConnectionError(f"Failed to get harvesters via RPC. Is your farmer running? {type(e).__name__}: {e}")
+        ts = datetime.now()
+        hosts = sorted(host for host, *_ in harvesters)
+        changed = hosts != self.harvester_hosts
+        self.harvester_hosts = hosts
+        for host, plot_totals, failed_plot_count, no_key_plot_count in harvesters:
+            og_plot_count, og_plot_size, portable_plot_count, portable_plot_size = plot_totals
+            event = HarvesterPlotsEvent(ts=ts,
+                                        plot_count=og_plot_count,
+                                        plot_size=og_plot_size,
+                                        portable_plot_count=portable_plot_count,
+                                        portable_plot_size=portable_plot_size,
+                                        failed_plot_count=failed_plot_count,
+                                        no_key_plot_count=no_key_plot_count,
+                                        host=host)
+            changed = await self.publish_event(event) or changed
+        return changed
+
+    async def get_pool_state(self) -> bool:
         try:
             pool_state = await self.farmer_client.get_pool_state()
+            changed = False
             for pool in pool_state["pool_state"]:
                 if pool["current_difficulty"] is not None:
                     points_24h = 0
@@ -159,26 +404,27 @@ class RpcCollector(Collector):
                         points_found_24h=points_24h,
                         points_acknowledged_24h=points_ack_24h,
                         num_pool_errors_24h=len(pool["pool_errors_24h"]))
-                    await self.publish_event(event)
+                    changed = await self.publish_event(event) or changed
+            return changed
         except Exception as e:
             self.log.error(e)
             raise ConnectionError("Failed to get pool state via RPC. Is your farmer running?")
 
-    async def get_blockchain_state(self) -> None:
+    async def get_blockchain_state(self) -> bool:
         try:
             state = await self.full_node_client.get_blockchain_state()
         except:
             raise ConnectionError("Failed to get blockchain state via RPC. Is your full node running?")
         peak_height = state["peak"].height if state["peak"] is not None else 0
         event = BlockchainStateEvent(ts=datetime.now(),
-                                     space=str(state["space"]),
+                                     space=float(state["space"]),
                                      diffculty=state["difficulty"],
-                                     peak_height=str(peak_height),
+                                     peak_height=peak_height,
                                      mempool_size=state["mempool_size"],
                                      synced=state["sync"]["synced"])
-        await self.publish_event(event)
+        return await self.publish_event(event)
 
-    async def get_connections(self) -> None:
+    async def get_connections(self) -> bool:
         full_node_connections = []
         farmer_connections = []
         wallet_connections = []
@@ -200,16 +446,67 @@ class RpcCollector(Collector):
                                  farmer_count=len(farmer_connections),
                                  wallet_count=len(wallet_connections),
                                  harvester_count=len(harvester_connections))
-        await self.publish_event(event)
+        return await self.publish_event(event)
 
-    async def task(self) -> None:
+    @staticmethod
+    async def run_task(task: Callable, timeout_seconds: float) -> bool:
+        start = perf_counter()
+        try:
+            return await asyncio.wait_for(task(), timeout_seconds)
+        except Exception:
+            ChiaExporter.rpc_task_errors_counter.labels(task.__name__).inc()
+            raise
+        finally:
+            ChiaExporter.rpc_task_time.labels(task.__name__).observe(perf_counter() - start)
+
+    def next_interval(self, interval: float, min_interval: float, changed: bool) -> float:
+        if self.max_interval_seconds is None or changed:
+            return min_interval
+        return min(interval * self.backoff_factor, max(min_interval, self.max_interval_seconds))
+
+    async def wait(self, trigger: asyncio.Event, deadline: float, earliest: float) -> float:
+        # Returns the time the run is due, which is earlier than the deadline if it was triggered
+        loop = asyncio.get_running_loop()
+        try:
+            # The jitter keeps tasks with the same interval from calling the services at the same time
+            await asyncio.wait_for(trigger.wait(), max(0, deadline - loop.time()) + random.uniform(0, self.jitter_seconds))
+        except asyncio.TimeoutError:
+            return deadline
+        # Triggered runs still keep the minimum interval to the previous run
+        deadline = min(deadline, max(loop.time(), earliest))
+        await asyncio.sleep(max(0, deadline - loop.time()))
+        return deadline
+
+    async def schedule(self, task: Callable) -> None:
+        loop = asyncio.get_running_loop()
+        trigger = self.triggers[task.__name__]
+        min_interval = self.task_intervals.get(task.__name__, self.refresh_interval_seconds)
+        interval = min_interval
+        deadline = earliest = loop.time()
         while True:
+            ChiaExporter.rpc_task_interval.labels(task.__name__).set(interval)
+            deadline = await self.wait(trigger, deadline, earliest)
+            trigger.clear()
+            earliest = loop.time() + min_interval
             try:
-                await asyncio.gather(*[task() for task in self.tasks])
+                changed = await RpcCollector.run_task(task, self.timeout_seconds)
+                interval = self.next_interval(interval, min_interval, changed)
+            except asyncio.TimeoutError:
+                self.log.warning(f"Timed out after {self.timeout_seconds}s while running {task.__name__}. "
+                                 f"Trying again...")
             except Exception as e:
                 self.log.warning(
-                    f"Error while collecting events. Trying again... {type(e).__name__}: {e}")
-            await asyncio.sleep(self.refresh_interval_seconds)
+                    f"Error while collecting events in {task.__name__}. Trying again... {type(e).__name__}: {e}")
+            deadline += interval
+            if loop.time() > deadline:
+                # Runs that were due while the task was still busy are skipped instead of running back to back
+                missed = int((loop.time() - deadline) // interval) + 1
+                ChiaExporter.rpc_missed_deadlines_counter.labels(task.__name__).inc(missed)
+                deadline += missed * interval
+
+    async def task(self) -> None:
+        # Each task runs on its own schedule, so a slow or failing service doesn't hold back the others
+        await asyncio.gather(*[self.schedule(task) for task in self.tasks])
 
     @staticmethod
     async def close_rpc_client(rpc_client: RpcClient) -> None:
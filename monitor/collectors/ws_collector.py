@@ -5,7 +5,8 @@ from asyncio import Queue
 from datetime import datetime
 from pathlib import Path
 from secrets import token_bytes
-from typing import Dict
+from time import monotonic
+from typing import Dict, Tuple
 
 import aiohttp
 from chia.server.server import ssl_context_for_client
@@ -59,31 +60,42 @@ class WsCollector(Collector):
             await self.close()
             raise ConnectionError("Failed to subscribe to daemon WebSocket")
 
-    async def process_farming_info(self, farming_info: Dict) -> None:
-        event = FarmingInfoEvent(ts=datetime.now(),
+    async def process_farming_info(self, farming_info: Dict, received_ts: datetime, received_monotonic: float) -> None:
+        event = FarmingInfoEvent(ts=received_ts,
                                  challenge_hash=farming_info["challenge_hash"],
                                  signage_point=farming_info["signage_point"],
                                  passed_filter=farming_info["passed_filter"],
                                  proofs=farming_info["proofs"],
                                  total_plots=farming_info["total_plots"])
+        event.received_monotonic = received_monotonic
         await self.publish_event(event)
 
-    async def process_signage_point(self, signage_point: Dict) -> None:
-        event = SignagePointEvent(ts=datetime.now(),
+    async def process_signage_point(self, signage_point: Dict, received_ts: datetime, received_monotonic: float) -> None:
+        event = SignagePointEvent(ts=received_ts,
                                   challenge_hash=signage_point["challenge_hash"],
                                   signage_point_index=signage_point["signage_point_index"],
                                   signage_point=signage_point["challenge_chain_sp"])
+        event.received_monotonic = received_monotonic
         await self.publish_event(event)
 
+    async def receive(self) -> Tuple[Dict, datetime, float]:
+        msg = await self.ws.receive()
+        # aiohttp has no arrival time for a frame, so the stamp is taken as soon as receive() returns. It leaves out the
+        # JSON decoding and queueing, but not the time the frame waited in aiohttp's buffer for the loop to get to it
+        received_ts, received_monotonic = datetime.now(), monotonic()
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            raise TypeError(f"Received message {msg.type}:{msg.data!r} is not WSMsgType.TEXT")
+        return msg.json(), received_ts, received_monotonic
+
     async def task(self) -> None:
         while not self.closed:
             try:
-                msg = await self.ws.receive_json()
+                msg, received_ts, received_monotonic = await self.receive()
                 cmd = msg["command"]
                 if cmd == "new_farming_info":
-                    await self.process_farming_info(msg["data"]["farming_info"])
+                    await self.process_farming_info(msg["data"]["farming_info"], received_ts, received_monotonic)
                 elif cmd == "new_signage_point":
-                    await self.process_signage_point(msg["data"]["signage_point"])
+                    await self.process_signage_point(msg["data"]["signage_point"], received_ts, received_monotonic)
             except Exception as e:
                 if self.closed:
                     break
@@ -1,6 +1,11 @@
-from sqlalchemy import MetaData, create_engine
+import logging
+from typing import Dict, Union
+
+from sqlalchemy import MetaData, create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 DATABASE_URL = "sqlite:///history.sqlite"
 
@@ -16,3 +21,42 @@ ChiaEvent = declarative_base(metadata=meta)
 
 engine = create_engine(DATABASE_URL, echo=False)
 session = sessionmaker(engine, expire_on_commit=False)
+
+
+def create_sqlite_engine(url: str, pool_size: int, pragmas: Dict[str, Union[str, int]]) -> Engine:
+    # Connections are shared by the event loop, the DB writer and the notifier thread
+    sqlite_engine = create_engine(url,
+                                  echo=False,
+                                  poolclass=QueuePool,
+                                  pool_size=pool_size,
+                                  connect_args={"check_same_thread": False})
+
+    @event.listens_for(sqlite_engine, "connect")
+    def set_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return sqlite_engine
+
+
+def configure_engine(url: str, pool_size: int, pragmas: Dict[str, Union[str, int]]) -> None:
+    global engine
+    engine.dispose()
+    if make_url(url).get_backend_name() == "sqlite":
+        engine = create_sqlite_engine(url, pool_size, pragmas)
+    else:
+        engine = create_engine(url, echo=False, pool_size=pool_size)
+    session.configure(bind=engine)
+
+
+def check_pragmas(pragmas: Dict[str, Union[str, int]]) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        effective = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in pragmas}
+    logging.info("💾 SQLite settings: " + ", ".join(f"{name}={value}" for name, value in effective.items()))
+    if "journal_mode" in pragmas and str(effective["journal_mode"]).lower() != str(pragmas["journal_mode"]).lower():
+        logging.warning(f"SQLite is using journal_mode={effective['journal_mode']} instead of "
+                        f"{pragmas['journal_mode']}. Reads and writes may block each other.")
@@ -1,22 +1,27 @@
 from monitor.database import ChiaEvent
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from monitor.database.types import EpochMillis, Hash32
+from sqlalchemy import BigInteger, Boolean, Column, Float, Index, Integer, String
 
 
 class HarvesterPlotsEvent(ChiaEvent):
     __tablename__ = "harvester_events"
+    __table_args__ = (Index("ix_harvester_events_host_ts", "host", "ts"), )
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
+    ts = Column(EpochMillis, index=True, nullable=False)
     host = Column(String(255), nullable=False)
     plot_count = Column(Integer)
     portable_plot_count = Column(Integer)
     plot_size = Column(Integer)
     portable_plot_size = Column(Integer)
+    # Plots the harvester failed to open or has no key for
+    failed_plot_count = Column(Integer)
+    no_key_plot_count = Column(Integer)
 
 
 class ConnectionsEvent(ChiaEvent):
     __tablename__ = "connection_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
+    ts = Column(EpochMillis, index=True, nullable=False)
     full_node_count = Column(Integer)
     farmer_count = Column(Integer)
     wallet_count = Column(Integer)
@@ -26,10 +31,11 @@ class ConnectionsEvent(ChiaEvent):
 class BlockchainStateEvent(ChiaEvent):
     __tablename__ = "blockchain_state_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
-    space = Column(String(32))
+    ts = Column(EpochMillis, index=True, nullable=False)
+    # Netspace exceeds the 64-bit integer range, so it is stored as a double
+    space = Column(Float)
     diffculty = Column(Integer)
-    peak_height = Column(String(32))
+    peak_height = Column(BigInteger)
     mempool_size = Column(Integer)
     synced = Column(Boolean())
 
@@ -37,35 +43,52 @@ class BlockchainStateEvent(ChiaEvent):
 class WalletBalanceEvent(ChiaEvent):
     __tablename__ = "wallet_balance_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
-    confirmed = Column(String(32))
-    farmed = Column(String(32))
+    ts = Column(EpochMillis, index=True, nullable=False)
+    confirmed = Column(BigInteger)
+    farmed = Column(BigInteger)
+
+
+class WalletEvent(ChiaEvent):
+    __tablename__ = "wallet_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    ts = Column(EpochMillis, index=True, nullable=False)
+    wallet_id = Column(Integer, nullable=False)
+    name = Column(String(255))
+    type = Column(Integer)
+    confirmed = Column(BigInteger)
+    spendable = Column(BigInteger)
 
 
 class SignagePointEvent(ChiaEvent):
     __tablename__ = "signage_point_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
-    challenge_hash = Column(String(66), index=True)
-    signage_point = Column(String(66), index=True)
+    ts = Column(EpochMillis, index=True, nullable=False)
+    challenge_hash = Column(Hash32, index=True)
+    signage_point = Column(Hash32, index=True)
     signage_point_index = Column(Integer)
+    # Set by the WebSocket collector when the frame was received, not persisted
+    received_monotonic = None
 
 
 class FarmingInfoEvent(ChiaEvent):
     __tablename__ = "farming_info_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
-    challenge_hash = Column(String(66), index=True)
-    signage_point = Column(String(66), index=True)
+    ts = Column(EpochMillis, index=True, nullable=False)
+    challenge_hash = Column(Hash32, index=True)
+    signage_point = Column(Hash32, index=True)
     passed_filter = Column(Integer)
     proofs = Column(Integer)
     total_plots = Column(Integer)
+    # Set by the enricher
+    lookup_time = Column(Float)
+    # Set by the WebSocket collector when the frame was received, not persisted
+    received_monotonic = None
 
 
 class PoolStateEvent(ChiaEvent):
     __tablename__ = "pool_state_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
+    ts = Column(EpochMillis, index=True, nullable=False)
     p2_singleton_puzzle_hash = Column(String(66), default="", nullable=False)
     pool_url = Column(String(255))
     current_points = Column(Integer)
@@ -80,8 +103,50 @@ class PoolStateEvent(ChiaEvent):
 class PriceEvent(ChiaEvent):
     __tablename__ = "price_events"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    ts = Column(DateTime, index=True, nullable=False)
+    ts = Column(EpochMillis, index=True, nullable=False)
     usd_cents = Column(Integer)
     eur_cents = Column(Integer)
     btc_satoshi = Column(Integer)
     eth_gwei = Column(Integer)
+
+
+MINUTE_RESOLUTION = 60
+HOUR_RESOLUTION = 3600
+
+
+class FarmingRollup(ChiaEvent):
+    __tablename__ = "farming_rollups"
+    __table_args__ = (Index("ix_farming_rollups_resolution_ts", "resolution", "ts", unique=True), )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Start of the aggregated period and its length in seconds
+    ts = Column(EpochMillis, nullable=False)
+    resolution = Column(Integer, nullable=False)
+    signage_points = Column(Integer, nullable=False)
+    farming_infos = Column(Integer, nullable=False)
+    passed_filter = Column(Integer, nullable=False)
+    proofs = Column(Integer, nullable=False)
+    lookup_time_count = Column(Integer, nullable=False)
+    lookup_time_sum = Column(Float, nullable=False)
+    lookup_time_max = Column(Float)
+
+
+class RollupWatermark(ChiaEvent):
+    __tablename__ = "rollup_watermarks"
+    # Highest id of a raw event table that is part of the rollups. Rows with a higher id are still only raw events,
+    # even if they were written after their period was rolled up.
+    table_name = Column(String(255), primary_key=True)
+    last_id = Column(Integer, nullable=False)
+
+
+FARMING_TOTALS_ID = 1
+
+
+class FarmingTotals(ChiaEvent):
+    __tablename__ = "farming_totals"
+    # A single row, updated by the DB writer in the same transaction as each batch of events
+    id = Column(Integer, primary_key=True)
+    farming_start = Column(EpochMillis)
+    signage_points = Column(BigInteger, nullable=False)
+    farming_infos = Column(BigInteger, nullable=False)
+    passed_filter = Column(BigInteger, nullable=False)
+    proofs = Column(BigInteger, nullable=False)
@@ -0,0 +1,28 @@
+from typing import Callable, Dict, List
+
+import sqlalchemy as sa
+from alembic import op
+
+CHUNK_SIZE = 10000
+
+
+def rebuild_table(name: str,
+                  columns: List[sa.Column],
+                  indexes: List[str],
+                  convert: Callable[[Dict], Dict],
+                  chunk_size: int = CHUNK_SIZE) -> None:
+    # SQLite can't change column types in place, so rows are copied into a new table one id range at a time
+    connection = op.get_bind()
+    source = sa.Table(name, sa.MetaData(), autoload_with=connection)
+    op.execute(f"DROP TABLE IF EXISTS _{name}_new")
+    target = op.create_table(f"_{name}_new", *columns, sa.PrimaryKeyConstraint("id", name=f"pk_{name}"))
+    max_id = connection.execute(sa.select(sa.func.max(source.c.id))).scalar()
+    for start in range(0, max_id or 0, chunk_size):
+        chunk = sa.and_(source.c.id > start, source.c.id <= start + chunk_size)
+        rows = connection.execute(sa.select(source).where(chunk)).mappings().all()
+        if len(rows) > 0:
+            connection.execute(target.insert(), [convert(dict(row)) for row in rows])
+    op.drop_table(name)
+    op.rename_table(target.name, name)
+    for column in indexes:
+        op.create_index(op.f(f"ix_{name}_{column}"), name, [column], unique=False)
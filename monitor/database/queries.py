@@ -1,30 +1,204 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from functools import lru_cache
-from typing import Optional, Tuple
-
-from monitor.database import session
-from monitor.database.events import (BlockchainStateEvent, ConnectionsEvent, FarmingInfoEvent, HarvesterPlotsEvent,
-                                     SignagePointEvent, WalletBalanceEvent)
-from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import select
+from functools import wraps
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Type
+
+from monitor.database import ChiaEvent
+from monitor.database.events import (FARMING_TOTALS_ID, HOUR_RESOLUTION, MINUTE_RESOLUTION, BlockchainStateEvent,
+                                     ConnectionsEvent, FarmingInfoEvent, FarmingRollup, FarmingTotals, HarvesterPlotsEvent,
+                                     PoolStateEvent, PriceEvent, RollupWatermark, SignagePointEvent, WalletBalanceEvent,
+                                     WalletEvent)
+from monitor.database.types import millis_to_datetime
+from monitor.exporter import ChiaExporter
+from sqlalchemy import BigInteger
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql.expression import ColumnElement, and_, false, or_, select, type_coerce
 from sqlalchemy.sql.functions import func
 
+# How old the latest stored row of a snapshot that is still being polled can be
+snapshot_max_age = timedelta(seconds=30)
+
+
+def configure_snapshot_max_age(heartbeat_interval_seconds: int, poll_interval_seconds: float) -> None:
+    global snapshot_max_age
+    # An unchanged snapshot is only stored by the first poll at least one heartbeat after the previous row
+    snapshot_max_age = timedelta(seconds=heartbeat_interval_seconds + poll_interval_seconds)
+
+
+class QueryCache:
+    max_size: int
+    # Bumped whenever rows of a table are written, which invalidates all results read from it
+    generations: Dict[str, int]
+    entries: "OrderedDict[Hashable, Tuple[Tuple[int, ...], Optional[float], Any]]"
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.generations = {}
+        self.entries = OrderedDict()
+        # Results are read by the notifier thread while the DB writer thread bumps the generations
+        self.lock = Lock()
+
+    def bump(self, tables: Iterable[str]) -> None:
+        with self.lock:
+            for table in tables:
+                self.generations[table] = self.generations.get(table, 0) + 1
+
+    def get_generations(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        with self.lock:
+            return tuple(self.generations.get(table, 0) for table in tables)
+
+    def get(self, key: Hashable, tables: Tuple[str, ...]) -> Tuple[bool, Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            generations, expires, value = entry
+            current = tuple(self.generations.get(table, 0) for table in tables)
+            if generations != current or (expires is not None and monotonic() > expires):
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: Hashable, generations: Tuple[int, ...], ttl: Optional[timedelta], value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        expires = None if ttl is None else monotonic() + ttl.total_seconds()
+        with self.lock:
+            self.entries[key] = (generations, expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+query_cache = QueryCache(256)
+# Queries relative to the current time are also recomputed after this long, even if no rows were written
+WINDOW_QUERY_TTL = timedelta(seconds=10)
+
+
+def configure_query_cache(max_size: int) -> None:
+    query_cache.max_size = max_size
+    query_cache.clear()
+
+
+def invalidate_queries(models: Iterable[Type[ChiaEvent]]) -> None:
+    query_cache.bump({model.__tablename__ for model in models})
 
-def get_proofs_found(db_session: Session) -> Optional[int]:
-    result = db_session.execute(select(func.sum(FarmingInfoEvent.proofs)))
-    return result.scalars().first()
 
+def cached(*models: Type[ChiaEvent], ttl: Optional[timedelta] = None) -> Callable:
+    tables = tuple(model.__tablename__ for model in models)
 
-def get_harvester_count(db_session: Session) -> Optional[int]:
-    result = db_session.execute(select(ConnectionsEvent.harvester_count).order_by(ConnectionsEvent.ts.desc()))
+    def decorator(function: Callable) -> Callable:
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            # The session is not part of the key, results are shared between sessions
+            key = (function.__name__, tuple(arg for arg in args if not isinstance(arg, Session)),
+                   tuple((name, value) for name, value in sorted(kwargs.items()) if not isinstance(value, Session)))
+            hit, value = query_cache.get(key, tables)
+            ChiaExporter.query_cache_counter.labels("hit" if hit else "miss").inc()
+            if hit:
+                return value
+            # Read before querying, so a write during the query invalidates the result
+            generations = query_cache.get_generations(tables)
+            value = function(*args, **kwargs)
+            query_cache.put(key, generations, ttl, value)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def get_rollup_start(db_session: Session, resolution: int) -> Optional[datetime]:
+    result = db_session.execute(select(func.min(FarmingRollup.ts)).where(FarmingRollup.resolution == resolution))
     return result.scalars().first()
 
 
-def get_sync_status(db_session: Session) -> Optional[bool]:
-    result = db_session.execute(select(BlockchainStateEvent.synced).order_by(BlockchainStateEvent.ts.desc()))
+def get_rollup_end(db_session: Session, resolution: Optional[int] = None) -> Optional[datetime]:
+    end = type_coerce(FarmingRollup.ts, BigInteger) + FarmingRollup.resolution * 1000
+    query = select(func.max(end))
+    if resolution is not None:
+        query = query.where(FarmingRollup.resolution == resolution)
+    result = db_session.execute(query)
+    end_ms = result.scalars().first()
+    return None if end_ms is None else millis_to_datetime(end_ms)
+
+
+def get_rollup_watermark(db_session: Session, model: Type[ChiaEvent]) -> Optional[int]:
+    watermark = db_session.get(RollupWatermark, model.__tablename__)
+    return None if watermark is None else watermark.last_id
+
+
+def sum_with_rollups(db_session: Session,
+                     model: Type[ChiaEvent],
+                     raw_sum: ColumnElement,
+                     rollup_column: ColumnElement,
+                     since: Optional[datetime] = None) -> Optional[int]:
+    # Rolled up periods are read from the hour and minute rollups, only the rest from the raw events
+    raw_end = get_rollup_end(db_session)
+    minute_start = get_rollup_start(db_session, MINUTE_RESOLUTION)
+    raw_query = select(raw_sum)
+    minute_query = select(func.sum(rollup_column)).where(FarmingRollup.resolution == MINUTE_RESOLUTION)
+    hour_query = select(func.sum(rollup_column)).where(FarmingRollup.resolution == HOUR_RESOLUTION)
+    if raw_end is not None:
+        # Rows written after their period was rolled up are not part of the rollups until the next run
+        watermark = get_rollup_watermark(db_session, model)
+        late = false() if watermark is None else model.id > watermark
+        raw_query = raw_query.where(or_(model.ts >= raw_end, late))
+    if minute_start is not None:
+        hour_query = hour_query.where(FarmingRollup.ts <= minute_start - timedelta(seconds=HOUR_RESOLUTION))
+    if since is not None:
+        raw_query = raw_query.where(model.ts >= since)
+        minute_query = minute_query.where(FarmingRollup.ts >= since)
+        hour_query = hour_query.where(FarmingRollup.ts >= since)
+    sums = [db_session.execute(query).scalars().first() for query in [raw_query, minute_query, hour_query]]
+    sums = [value for value in sums if value is not None]
+    return sum(sums) if len(sums) > 0 else None
+
+
+def count_signage_points(db_session: Session) -> Optional[int]:
+    return sum_with_rollups(db_session, SignagePointEvent, func.count(SignagePointEvent.ts), FarmingRollup.signage_points)
+
+
+def count_farming_infos(db_session: Session) -> Optional[int]:
+    return sum_with_rollups(db_session, FarmingInfoEvent, func.count(FarmingInfoEvent.ts), FarmingRollup.farming_infos)
+
+
+def count_passed_filters(db_session: Session) -> Optional[int]:
+    return sum_with_rollups(db_session, FarmingInfoEvent, func.sum(FarmingInfoEvent.passed_filter),
+                            FarmingRollup.passed_filter)
+
+
+def count_proofs_found(db_session: Session) -> Optional[int]:
+    return sum_with_rollups(db_session, FarmingInfoEvent, func.sum(FarmingInfoEvent.proofs), FarmingRollup.proofs)
+
+
+def find_farming_start(db_session: Session) -> Optional[datetime]:
+    result = db_session.execute(select(func.min(FarmingRollup.ts)).where(FarmingRollup.farming_infos > 0))
+    rollup_start = result.scalars().first()
+    if rollup_start is not None:
+        return rollup_start
+    result = db_session.execute(select(func.min(FarmingInfoEvent.ts)))
     return result.scalars().first()
 
 
+def get_farming_totals(db_session: Session) -> Optional[FarmingTotals]:
+    return db_session.get(FarmingTotals, FARMING_TOTALS_ID)
+
+
+@cached(FarmingTotals)
+def get_proofs_found(db_session: Session) -> Optional[int]:
+    totals = get_farming_totals(db_session)
+    return None if totals is None else totals.proofs
+
+
 def get_blockchain_state(db_session: Session) -> Optional[BlockchainStateEvent]:
     result = db_session.execute(select(BlockchainStateEvent).order_by(BlockchainStateEvent.ts.desc()))
     return result.scalars().first()
@@ -40,146 +214,98 @@ def get_connections(db_session: Session) -> Optional[ConnectionsEvent]:
     return result.scalars().first()
 
 
+@cached(FarmingTotals)
 def get_farming_start(db_session: Session) -> Optional[datetime]:
-    result = db_session.execute(select(func.min(FarmingInfoEvent.ts)))
-    return result.scalars().first()
+    totals = get_farming_totals(db_session)
+    return None if totals is None else totals.farming_start
+
+
+def get_plot_snapshots(db_session: Session, at: Optional[datetime] = None) -> List[HarvesterPlotsEvent]:
+    # The snapshot of each host that was valid at the given time, or its first one after if it appeared later.
+    # Hosts and their snapshots are looked up with index seeks on (host, ts) instead of scanning the time range.
+    at = datetime.now() if at is None else at
+    next_host = aliased(HarvesterPlotsEvent)
+    hosts = select(func.min(HarvesterPlotsEvent.host).label("host")).cte("hosts", recursive=True)
+    hosts = hosts.union_all(
+        select(select(func.min(next_host.host)).where(next_host.host > hosts.c.host).scalar_subquery()).where(
+            hosts.c.host.isnot(None)))
+    before = aliased(HarvesterPlotsEvent)
+    valid_before = and_(before.host == hosts.c.host, before.ts <= at, before.ts > at - snapshot_max_age)
+    latest_before = select(before.id).where(valid_before).order_by(before.ts.desc()).limit(1)
+    after = aliased(HarvesterPlotsEvent)
+    first_after = select(after.id).where(after.host == hosts.c.host, after.ts > at).order_by(after.ts).limit(1)
+    snapshot_ids = select(func.coalesce(latest_before.scalar_subquery(),
+                                        first_after.scalar_subquery())).select_from(hosts).where(hosts.c.host.isnot(None))
+    result = db_session.execute(select(HarvesterPlotsEvent).where(HarvesterPlotsEvent.id.in_(snapshot_ids)))
+    return result.scalars().all()
+
+
+def sum_plots(snapshots: List[HarvesterPlotsEvent]) -> Optional[Tuple[int, int, int, int]]:
+    if len(snapshots) == 0:
+        return None
+    plot_count = sum(snapshot.plot_count or 0 for snapshot in snapshots)
+    portable_plot_count = sum(snapshot.portable_plot_count or 0 for snapshot in snapshots)
+    plot_size = sum(snapshot.plot_size or 0 for snapshot in snapshots)
+    portable_plot_size = sum(snapshot.portable_plot_size or 0 for snapshot in snapshots)
+    return plot_count, portable_plot_count, plot_size, portable_plot_size
+
+
+def get_latest_pool_states(db_session: Session) -> List[PoolStateEvent]:
+    latest_ids = select(func.max(PoolStateEvent.id)).where(PoolStateEvent.ts > datetime.now() - snapshot_max_age).group_by(
+        PoolStateEvent.p2_singleton_puzzle_hash)
+    result = db_session.execute(select(PoolStateEvent).where(PoolStateEvent.id.in_(latest_ids)))
+    return result.scalars().all()
 
 
-def get_previous_signage_point(db_session: Session) -> Optional[str]:
-    result = db_session.execute(
-        select(FarmingInfoEvent.signage_point).order_by(FarmingInfoEvent.ts.desc()).distinct(
-            FarmingInfoEvent.signage_point).limit(2))
-    return result.all()[-1][0]
+def get_latest_wallets(db_session: Session) -> List[WalletEvent]:
+    latest_ids = select(func.max(WalletEvent.id)).where(WalletEvent.ts > datetime.now() - snapshot_max_age).group_by(
+        WalletEvent.wallet_id)
+    result = db_session.execute(select(WalletEvent).where(WalletEvent.id.in_(latest_ids)))
+    return result.scalars().all()
 
 
+def get_price(db_session: Session) -> Optional[PriceEvent]:
+    result = db_session.execute(select(PriceEvent).order_by(PriceEvent.ts.desc()))
+    return result.scalars().first()
+
+
+@cached(HarvesterPlotsEvent, ttl=WINDOW_QUERY_TTL)
 def get_plot_delta(db_session: Session, period=timedelta(hours=24)) -> Tuple[int, int]:
     result = db_session.execute(select(func.min(HarvesterPlotsEvent.ts)))
     first_ts = result.scalars().first()
     if first_ts is None:
         return 0, 0
     initial_ts = max(first_ts, datetime.now() - period)
-    sub_query = select([
-        HarvesterPlotsEvent.plot_count, HarvesterPlotsEvent.portable_plot_count, HarvesterPlotsEvent.plot_size,
-        HarvesterPlotsEvent.portable_plot_size
-    ]).where(HarvesterPlotsEvent.ts > initial_ts).order_by(HarvesterPlotsEvent.ts).group_by(HarvesterPlotsEvent.host)
-    result = db_session.execute(
-        select([
-            func.sum(sub_query.c.plot_count),
-            func.sum(sub_query.c.portable_plot_count),
-            func.sum(sub_query.c.plot_size),
-            func.sum(sub_query.c.portable_plot_size)
-        ]))
-    initial_plots = result.one()
-    if initial_plots is None:
+    initial_plots = sum_plots(get_plot_snapshots(db_session, initial_ts))
+    current_plots = sum_plots(get_plot_snapshots(db_session))
+    if initial_plots is None or current_plots is None:
         return 0, 0
     initial_og_plot_count, initial_portable_plot_count, initial_og_plot_size, initial_portable_plot_size = initial_plots
-    initial_plot_count = initial_og_plot_count + initial_portable_plot_count
-    initial_plot_size = initial_og_plot_size + initial_portable_plot_size
-    current_plot_count = get_plot_count(db_session)
-    if current_plot_count is None:
-        return 0, 0
-    current_plot_size = get_plot_size(db_session)
-    if current_plot_size is None:
-        return 0, 0
-    return current_plot_count - initial_plot_count, current_plot_size - initial_plot_size
-
-
-def get_plot_count(db_session: Session) -> Optional[int]:
-    og_plot_count = get_og_plot_count(db_session)
-    portable_plot_count = get_portable_plot_count(db_session)
-    if og_plot_count is not None and portable_plot_count is not None:
-        return og_plot_count + portable_plot_count
-    elif og_plot_count is not None and portable_plot_count is None:
-        return og_plot_count
-    elif og_plot_count is None and portable_plot_count is not None:
-        return portable_plot_count
-    else:
-        return None
-
-
-def get_plot_size(db_session: Session) -> Optional[int]:
-    og_plot_size = get_og_plot_size(db_session)
-    portable_plot_size = get_portable_plot_size(db_session)
-    if og_plot_size is not None and portable_plot_size is not None:
-        return og_plot_size + portable_plot_size
-    elif og_plot_size is not None and portable_plot_size is None:
-        return og_plot_size
-    elif og_plot_size is None and portable_plot_size is not None:
-        return portable_plot_size
-    else:
-        return None
-
-
-def get_og_plot_size(db_session: Session) -> Optional[int]:
-    sub_query = select([
-        func.max(HarvesterPlotsEvent.plot_size).label("plot_size")
-    ]).where(HarvesterPlotsEvent.ts > datetime.now() - timedelta(seconds=30)).group_by(HarvesterPlotsEvent.host)
-    result = db_session.execute(select(func.sum(sub_query.c.plot_size)))
-    return result.scalars().first()
-
-
-def get_og_plot_count(db_session: Session) -> Optional[int]:
-    sub_query = select([
-        func.max(HarvesterPlotsEvent.plot_count).label("plot_count")
-    ]).where(HarvesterPlotsEvent.ts > datetime.now() - timedelta(seconds=30)).group_by(HarvesterPlotsEvent.host)
-    result = db_session.execute(select(func.sum(sub_query.c.plot_count)))
-    return result.scalars().first()
-
-
-def get_portable_plot_size(db_session: Session) -> Optional[int]:
-    sub_query = select([
-        func.max(HarvesterPlotsEvent.portable_plot_size).label("portable_plot_size")
-    ]).where(HarvesterPlotsEvent.ts > datetime.now() - timedelta(seconds=30)).group_by(HarvesterPlotsEvent.host)
-    result = db_session.execute(select(func.sum(sub_query.c.portable_plot_size)))
-    return result.scalars().first()
-
-
-def get_portable_plot_count(db_session: Session) -> Optional[int]:
-    sub_query = select([
-        func.max(HarvesterPlotsEvent.portable_plot_count).label("portable_plot_count")
-    ]).where(HarvesterPlotsEvent.ts > datetime.now() - timedelta(seconds=30)).group_by(HarvesterPlotsEvent.host)
-    result = db_session.execute(select(func.sum(sub_query.c.portable_plot_count)))
-    return result.scalars().first()
+    og_plot_count, portable_plot_count, og_plot_size, portable_plot_size = current_plots
+    return (og_plot_count + portable_plot_count - initial_og_plot_count - initial_portable_plot_count,
+            og_plot_size + portable_plot_size - initial_og_plot_size - initial_portable_plot_size)
 
 
+@cached(SignagePointEvent, FarmingRollup, ttl=WINDOW_QUERY_TTL)
 def get_signage_points_per_minute(db_session: Session, interval: timedelta) -> Optional[float]:
-    result = db_session.execute(
-        select(func.count(SignagePointEvent.ts)).where(SignagePointEvent.ts >= datetime.now() - interval))
-    num_signage_points = result.scalars().first()
+    num_signage_points = sum_with_rollups(db_session, SignagePointEvent, func.count(SignagePointEvent.ts),
+                                          FarmingRollup.signage_points,
+                                          datetime.now() - interval)
     if num_signage_points is None:
         return None
     return num_signage_points / (interval.seconds / 60)
 
 
+@cached(FarmingInfoEvent, FarmingRollup, ttl=WINDOW_QUERY_TTL)
 def get_passed_filters_per_minute(db_session: Session, interval: timedelta) -> Optional[float]:
-    result = db_session.execute(
-        select(func.sum(FarmingInfoEvent.passed_filter)).where(FarmingInfoEvent.ts >= datetime.now() - interval))
-    passed_filters = result.scalars().first()
+    passed_filters = sum_with_rollups(db_session, FarmingInfoEvent, func.sum(FarmingInfoEvent.passed_filter),
+                                      FarmingRollup.passed_filter,
+                                      datetime.now() - interval)
     if passed_filters is None:
         return None
     return passed_filters / (interval.seconds / 60)
 
 
-def get_current_balance(db_session: Session) -> int:
-    result = db_session.execute(select(WalletBalanceEvent.confirmed).order_by(WalletBalanceEvent.ts.desc()))
-    return result.scalars().first()
-
-
-def get_last_payment(db_session: Session) -> int:
-    current_balance = get_current_balance(db_session)
-    previous_balance_query = db_session.execute(
-        select(WalletBalanceEvent.confirmed).where(WalletBalanceEvent.confirmed != current_balance).order_by(
-            WalletBalanceEvent.ts.desc()))
-    last_balance = previous_balance_query.scalars().first()
-    return int(current_balance) - int(last_balance)
-
-
-@lru_cache(maxsize=16)
-def get_signage_point_ts(signage_point: str, db_session: Session = None) -> datetime:
-    query = select(SignagePointEvent.ts).where(SignagePointEvent.signage_point == signage_point)
-    if db_session is not None:
-        result = db_session.execute(query)
-        return result.scalars().first()
-    with session() as db_session:
-        result = db_session.execute(query)
-        return result.scalars().first()
+def get_recent_signage_points(db_session: Session, limit: int) -> List[SignagePointEvent]:
+    result = db_session.execute(select(SignagePointEvent).order_by(SignagePointEvent.ts.desc()).limit(limit))
+    return result.scalars().all()
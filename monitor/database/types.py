@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+
+def hash_to_bytes(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def bytes_to_hash(value: bytes) -> str:
+    return "0x" + value.hex()
+
+
+def datetime_to_millis(value: datetime) -> int:
+    return round(value.timestamp() * 1000)
+
+
+def millis_to_datetime(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000)
+
+
+class Hash32(TypeDecorator):
+    # Hashes are stored as 32-byte blobs, but read and written as 0x-prefixed hex strings
+    impl = LargeBinary(32)
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Optional[bytes]:
+        return None if value is None else hash_to_bytes(value)
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[str]:
+        return None if value is None else bytes_to_hash(value)
+
+
+class EpochMillis(TypeDecorator):
+    # Timestamps are stored as integer milliseconds since the epoch, but read and written as local datetimes
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[datetime], dialect) -> Optional[int]:
+        return None if value is None else datetime_to_millis(value)
+
+    def process_result_value(self, value: Optional[int], dialect) -> Optional[datetime]:
+        return None if value is None else millis_to_datetime(value)
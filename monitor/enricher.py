@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import List, Optional
+
+from monitor.database import ChiaEvent
+from monitor.database.events import FarmingInfoEvent, SignagePointEvent
+from monitor.exporter import ChiaExporter
+
+
+class SignagePointIndex:
+    max_size: int
+    signage_points: "OrderedDict[str, SignagePointEvent]"
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.signage_points = OrderedDict()
+
+    def add(self, event: SignagePointEvent) -> None:
+        self.signage_points[event.signage_point] = event
+        self.signage_points.move_to_end(event.signage_point)
+        if len(self.signage_points) > self.max_size:
+            self.signage_points.popitem(last=False)
+
+    def load(self, events: List[SignagePointEvent]) -> None:
+        for event in sorted(events, key=lambda event: event.ts):
+            self.add(event)
+
+    def get(self, signage_point: str) -> Optional[SignagePointEvent]:
+        return self.signage_points.get(signage_point)
+
+
+class Enricher:
+    index: SignagePointIndex
+
+    def __init__(self, index_size: int = 256) -> None:
+        self.index = SignagePointIndex(index_size)
+
+    @staticmethod
+    def lookup_time(event: FarmingInfoEvent, signage_point: SignagePointEvent) -> float:
+        if event.received_monotonic is not None and signage_point.received_monotonic is not None:
+            return event.received_monotonic - signage_point.received_monotonic
+        return (event.ts - signage_point.ts).total_seconds()
+
+    def process_event(self, event: ChiaEvent) -> None:
+        if isinstance(event, SignagePointEvent):
+            self.index.add(event)
+        elif isinstance(event, FarmingInfoEvent):
+            signage_point = self.index.get(event.signage_point)
+            if signage_point is not None:
+                event.lookup_time = Enricher.lookup_time(event, signage_point)
+        else:
+            return
+        if event.received_monotonic is not None:
+            ChiaExporter.ws_processing_delay.observe(monotonic() - event.received_monotonic)
@@ -1,65 +1,133 @@
-from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import gzip
+from hashlib import blake2b
+from datetime import datetime, timedelta
+from time import monotonic, time
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.openmetrics.exposition import generate_latest as generate_latest_openmetrics
 
 from monitor.database.events import (BlockchainStateEvent, ChiaEvent, ConnectionsEvent, FarmingInfoEvent,
-                                     HarvesterPlotsEvent, PoolStateEvent, PriceEvent, SignagePointEvent, WalletBalanceEvent)
-from monitor.database.queries import get_signage_point_ts
+                                     HarvesterPlotsEvent, PoolStateEvent, PriceEvent, SignagePointEvent, WalletBalanceEvent,
+                                     WalletEvent)
+from monitor.sketch import LookupTimeWindows, format_window
 
+LOOKUP_TIME_QUANTILES = [0.5, 0.95, 0.99]
+
+POOL_METRICS = [
+    ('chia_current_pool_points', 'Number of pooling points you have collected during this round', 'current_points'),
+    ('chia_current_pool_difficulty', 'Difficulty of partials you are submitting', 'current_difficulty'),
+    ('chia_pool_points_found_since_start', 'Total number of pooling points found', 'points_found_since_start'),
+    ('chia_pool_points_acknowledged_since_start', 'Total number of pooling points acknowledged',
+     'points_acknowledged_since_start'),
+    ('chia_pool_points_found_24h', 'Number of pooling points found the last 24h', 'points_found_24h'),
+    ('chia_pool_points_acknowledged_24h', 'Number of pooling points acknowledged the last 24h', 'points_acknowledged_24h'),
+    ('chia_num_pool_errors_24h', 'Number of pool errors during the last 24 hours', 'num_pool_errors_24h'),
+]
+
+
+def gauge(name: str, documentation: str, event: Optional[ChiaEvent], attribute: str) -> GaugeMetricFamily:
+    # Columns can be NULL, e.g. the mempool size of older snapshots, which leaves the family without a sample
+    value = None if event is None else getattr(event, attribute)
+    return GaugeMetricFamily(name, documentation, value=None if value is None else int(value))
 
-class ChiaExporter:
-    # Wallet metrics
-    total_balance_gauge = Gauge('chia_confirmed_total_mojos', 'Sum of confirmed wallet balances')
-    total_farmed_gauge = Gauge('chia_farmed_total_mojos', 'Total chia farmed')
-
-    # Full node metrics
-    network_space_gauge = Gauge('chia_network_space', 'Approximation of current netspace')
-    diffculty_gauge = Gauge('chia_diffculty', 'Current networks farming difficulty')
-    height_gauge = Gauge('chia_peak_height', 'Block height of the current peak')
-    sync_gauge = Gauge('chia_sync_status', 'Sync status of the connected full node')
-    connections_gauge = Gauge('chia_connections_count', 'Count of peers that the node is currently connected to', ["type"])
-    mempool_size_gauge = Gauge('chia_mempool_size', 'Current mempool size')
-
-    # Harvester metrics
-    plot_count_gauge = Gauge('chia_plot_count', 'Plot count being farmed by harvester', ["host", "type"])
-    plot_size_gauge = Gauge('chia_plot_size', 'Size of plots being farmed by harvester', ["host", "type"])
 
+class ChiaExporter:
     # Farmer metrics
-    signage_point_counter = Counter('chia_signage_points', 'Received signage points')
-    signage_point_index_gauge = Gauge('chia_signage_point_index', 'Received signage point index')
-    challenges_counter = Counter('chia_block_challenges', 'Attempted block challenges')
-    passed_filter_counter = Counter('chia_plots_passed_filter', 'Plots passed filter')
-    proofs_found_counter = Counter('chia_proofs_found', 'Proofs found')
     lookup_time = Histogram('chia_lookup_time_seconds',
                             'Plot lookup time',
                             buckets=(.01, .05, .1, .25, .5, .75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 3.0, 3.25, 3.5,
                                      3.75, 4.0, 4.25, 4.5, 4.75, 5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0, 8.5, 9.0, 9.5, 10.0,
                                      11.0, 12.0, 13.0, 14.0, 15.0, 16.0, 17.0, 18.0, 19.0, 20.0, float("inf")))
 
-    # Pool metrics
-    current_pool_points_gauge = Gauge('chia_current_pool_points',
-                                      'Number of pooling points you have collected during this round', ['p2', 'url'])
-    current_pool_difficulty_gauge = Gauge('chia_current_pool_difficulty', 'Difficulty of partials you are submitting',
-                                          ['p2', 'url'])
-    pool_points_found_since_start_gauge = Gauge('chia_pool_points_found_since_start', 'Total number of pooling points found',
-                                                ['p2', 'url'])
-    pool_points_acknowledged_since_start_gauge = Gauge('chia_pool_points_acknowledged_since_start',
-                                                       'Total number of pooling points acknowledged', ['p2', 'url'])
-    pool_points_found_24h_gauge = Gauge('chia_pool_points_found_24h', 'Number of pooling points found the last 24h',
-                                        ['p2', 'url'])
-    pool_points_acknowledged_24h_gauge = Gauge('chia_pool_points_acknowledged_24h',
-                                               'Number of pooling points acknowledged the last 24h', ['p2', 'url'])
-    num_pool_errors_24h_gauge = Gauge('chia_num_pool_errors_24h', 'Number of pool errors during the last 24 hours',
-                                      ['p2', 'url'])
-
-    # Price metrics
-    price_usd_cents_gauge = Gauge('chia_price_usd_cent', 'Current Chia price in USD cent')
-    price_eur_cents_gauge = Gauge('chia_price_eur_cent', 'Current Chia price in EUR cent')
-    price_btc_satoshi_gauge = Gauge('chia_price_btc_satoshi', 'Current Chia price in BTC satoshi')
-    price_eth_gwei_gauge = Gauge('chia_price_eth_gwei', 'Current Chia price in ETH gwei')
+    # Monitor metrics
+    event_queue_size_gauge = Gauge('chia_monitor_event_queue_size', 'Number of events waiting to be dispatched')
+    events_counter = Counter('chia_monitor_events', 'Events dispatched to the sinks', ['type'])
+    sink_queue_size_gauge = Gauge('chia_monitor_sink_queue_size', 'Number of events waiting in a sink queue', ['sink'])
+    sink_processing_time = Histogram('chia_monitor_sink_processing_seconds',
+                                     'Time spent processing a single event in a sink', ['sink'],
+                                     buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0,
+                                              float("inf")))
+    sink_dropped_counter = Counter('chia_monitor_sink_dropped_events', 'Events dropped by a full sink queue', ['sink'])
+    coalesced_counter = Counter('chia_monitor_coalesced_events', 'Pending snapshot events replaced by a newer one',
+                                ['queue'])
+    db_flush_time = Histogram('chia_monitor_db_flush_seconds',
+                              'Time spent committing a batch of events to the DB',
+                              buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, float("inf")))
+    db_batch_size = Histogram('chia_monitor_db_batch_size',
+                              'Number of events committed per DB transaction',
+                              buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")))
+    ws_processing_delay = Histogram('chia_monitor_ws_processing_delay_seconds',
+                                    'Delay between ws.receive() returning a WebSocket frame and processing its event',
+                                    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5,
+                                             5.0, float("inf")))
+    rpc_task_time = Histogram('chia_monitor_rpc_task_seconds',
+                              'Time spent collecting events from an RPC endpoint', ['task'],
+                              buckets=(.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")))
+    rpc_task_errors_counter = Counter('chia_monitor_rpc_task_errors', 'Failed RPC collector tasks', ['task'])
+    rpc_missed_deadlines_counter = Counter('chia_monitor_rpc_task_missed_deadlines',
+                                           'RPC collector task runs skipped because the previous run was late', ['task'])
+    unchanged_harvesters_counter = Counter('chia_monitor_unchanged_harvesters',
+                                           'Harvesters whose plots were not summed again because they did not change')
+    harvester_rpc_time = Histogram('chia_monitor_harvester_rpc_seconds',
+                                   'Client-side time spent fetching and summing the plots of a remote harvester', ['host'],
+                                   buckets=(.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")))
+    harvester_rpc_errors_counter = Counter('chia_monitor_harvester_rpc_errors', 'Failed remote harvester polls', ['host'])
+    rpc_task_interval = Gauge('chia_monitor_rpc_task_interval_seconds', 'Current poll interval of an RPC collector task',
+                              ['task'])
+    evicted_series_counter = Counter('chia_monitor_evicted_series', 'Stale host or pool label sets no longer exported',
+                                     ['reason'])
+    notification_time = Histogram('chia_monitor_notification_seconds',
+                                  'Time spent checking and sending a notification', ['notification'],
+                                  buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, float("inf")))
+    rollup_time = Histogram('chia_monitor_rollup_seconds',
+                            'Time spent rolling up and pruning farming events',
+                            buckets=(.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")))
+    pruned_rows_counter = Counter('chia_monitor_pruned_rows', 'Rows deleted after their retention window', ['table'])
+    late_rows_counter = Counter('chia_monitor_late_rows', 'Rows merged into rollups after their period was rolled up',
+                                ['table'])
+    unchanged_snapshots_counter = Counter('chia_monitor_unchanged_snapshots', 'Unchanged snapshot events not written to DB',
+                                          ['type'])
+    query_cache_counter = Counter('chia_monitor_query_cache', 'DB query results served from or missing the cache',
+                                  ['result'])
+
+    # Encoded outputs are reused until new events arrive, but at most this long to keep the monitor metrics fresh
+    cache_max_age_seconds = 5
+    cached_outputs: Dict[Tuple[bool, bool], Tuple[bytes, str]]
 
     last_signage_point: SignagePointEvent = None
+    wallet_balance: Optional[WalletBalanceEvent] = None
+    blockchain_state: Optional[BlockchainStateEvent] = None
+    connections: Optional[ConnectionsEvent] = None
+    price: Optional[PriceEvent] = None
+    # Host, pool and wallet label sets are kept in least recently refreshed order
+    harvesters: Dict[str, HarvesterPlotsEvent]
+    pools: Dict[str, PoolStateEvent]
+    wallets: Dict[int, WalletEvent]
+    series_ttl: timedelta
+    max_series: int
+    lookup_time_windows: LookupTimeWindows
 
-    def __init__(self, port: int) -> None:
-        start_http_server(port)
+    def __init__(self, series_ttl_seconds: int, max_series: int, lookup_time_windows: LookupTimeWindows) -> None:
+        self.lookup_time_windows = lookup_time_windows
+        self.series_ttl = timedelta(seconds=series_ttl_seconds)
+        self.max_series = max_series
+        self.next_eviction_ts = 0.0
+        self.start_ts = time()
+        self.generation = 0
+        self.cached_generation = -1
+        self.cached_ts = 0.0
+        self.cached_outputs = {}
+        self.last_event_ts: Optional[float] = None
+        self.harvesters = {}
+        self.pools = {}
+        self.wallets = {}
+        self.signage_points = 0
+        self.challenges = 0
+        self.passed_filters = 0
+        self.proofs_found = 0
+        REGISTRY.register(self)
 
     def process_event(self, event: ChiaEvent) -> None:
         if isinstance(event, HarvesterPlotsEvent):
@@ -72,65 +140,190 @@ class ChiaExporter:
             self.update_blockchain_state_metrics(event)
         elif isinstance(event, WalletBalanceEvent):
             self.update_wallet_balance_metrics(event)
+        elif isinstance(event, WalletEvent):
+            self.update_wallet_metrics(event)
         elif isinstance(event, SignagePointEvent):
             self.update_signage_point_metrics(event)
         elif isinstance(event, PoolStateEvent):
             self.update_pool_state_metrics(event)
         elif isinstance(event, PriceEvent):
             self.update_price_metrics(event)
+        if monotonic() >= self.next_eviction_ts:
+            self.evict_stale_series()
+        self.generation += 1
+        self.last_event_ts = monotonic()
+
+    def store_series(self, series: Dict[Hashable, ChiaEvent], key: Hashable, event: ChiaEvent) -> None:
+        series.pop(key, None)
+        if len(series) >= self.max_series:
+            del series[next(iter(series))]
+            self.evicted_series_counter.labels("limit").inc()
+        series[key] = event
+
+    def evict_stale_series(self) -> None:
+        self.next_eviction_ts = monotonic() + min(self.series_ttl.total_seconds(), 60)
+        stale_ts = datetime.now() - self.series_ttl
+        for series in [self.harvesters, self.pools, self.wallets]:
+            while len(series) > 0:
+                key = next(iter(series))
+                if series[key].ts > stale_ts:
+                    break
+                del series[key]
+                self.evicted_series_counter.labels("ttl").inc()
 
     def update_harvester_metrics(self, event: HarvesterPlotsEvent) -> None:
-        self.plot_count_gauge.labels(event.host, "OG").set(event.plot_count)
-        self.plot_count_gauge.labels(event.host, "portable").set(event.portable_plot_count)
-        self.plot_size_gauge.labels(event.host, "OG").set(event.plot_size)
-        self.plot_size_gauge.labels(event.host, "portable").set(event.portable_plot_size)
+        self.store_series(self.harvesters, event.host, event)
 
     def update_farmer_metrics(self, event: FarmingInfoEvent):
-        self.challenges_counter.inc()
-        self.passed_filter_counter.inc(event.passed_filter)
-        self.proofs_found_counter.inc(event.proofs)
-        if self.last_signage_point is None:
-            return
-        if self.last_signage_point.signage_point == event.signage_point:
-            signage_point_ts = self.last_signage_point.ts
-        else:
-            signage_point_ts = get_signage_point_ts(event.signage_point)
-        lookup_time = event.ts - signage_point_ts
-        self.lookup_time.observe(lookup_time.total_seconds())
+        self.challenges += 1
+        self.passed_filters += event.passed_filter
+        self.proofs_found += event.proofs
+        if event.lookup_time is not None:
+            self.lookup_time.observe(event.lookup_time)
+            self.lookup_time_windows.add(event.lookup_time)
 
     def update_connection_metrics(self, event: ConnectionsEvent) -> None:
-        self.connections_gauge.labels("Full Node").set(event.full_node_count)
-        self.connections_gauge.labels("Farmer").set(event.farmer_count)
-        self.connections_gauge.labels("Harvester").set(event.harvester_count)
+        self.connections = event
 
     def update_blockchain_state_metrics(self, event: BlockchainStateEvent) -> None:
-        self.network_space_gauge.set(int(event.space))
-        self.diffculty_gauge.set(event.diffculty)
-        self.height_gauge.set(int(event.peak_height))
-        self.sync_gauge.set(event.synced)
-        self.mempool_size_gauge.set(event.mempool_size)
+        self.blockchain_state = event
 
     def update_wallet_balance_metrics(self, event: WalletBalanceEvent) -> None:
-        self.total_balance_gauge.set(int(event.confirmed))
-        self.total_farmed_gauge.set(int(event.farmed))
+        self.wallet_balance = event
+
+    def update_wallet_metrics(self, event: WalletEvent) -> None:
+        self.store_series(self.wallets, event.wallet_id, event)
 
     def update_signage_point_metrics(self, event: SignagePointEvent) -> None:
-        self.signage_point_counter.inc()
-        self.signage_point_index_gauge.set(event.signage_point_index)
+        self.signage_points += 1
         self.last_signage_point = event
 
     def update_pool_state_metrics(self, event: PoolStateEvent) -> None:
-        p2 = event.p2_singleton_puzzle_hash
-        self.current_pool_points_gauge.labels(p2, event.pool_url).set(event.current_points)
-        self.current_pool_difficulty_gauge.labels(p2, event.pool_url).set(event.current_difficulty)
-        self.pool_points_found_since_start_gauge.labels(p2, event.pool_url).set(event.points_found_since_start)
-        self.pool_points_acknowledged_since_start_gauge.labels(p2, event.pool_url).set(event.points_acknowledged_since_start)
-        self.pool_points_found_24h_gauge.labels(p2, event.pool_url).set(event.points_found_24h)
-        self.pool_points_acknowledged_24h_gauge.labels(p2, event.pool_url).set(event.points_acknowledged_24h)
-        self.num_pool_errors_24h_gauge.labels(p2, event.pool_url).set(event.num_pool_errors_24h)
+        self.store_series(self.pools, event.p2_singleton_puzzle_hash, event)
 
     def update_price_metrics(self, event: PriceEvent) -> None:
-        self.price_usd_cents_gauge.set(event.usd_cents)
-        self.price_eur_cents_gauge.set(event.eur_cents)
-        self.price_btc_satoshi_gauge.set(event.btc_satoshi)
-        self.price_eth_gwei_gauge.set(event.eth_gwei)
+        self.price = event
+
+    def collect(self) -> Iterator[Metric]:
+        wallet_balance = self.wallet_balance
+        blockchain_state = self.blockchain_state
+        connections = self.connections
+        price = self.price
+        harvesters = list(self.harvesters.values())
+        pools = list(self.pools.values())
+        wallets = list(self.wallets.values())
+
+        # Wallet metrics
+        yield gauge('chia_confirmed_total_mojos', 'Sum of confirmed wallet balances', wallet_balance, 'confirmed')
+        yield gauge('chia_farmed_total_mojos', 'Total chia farmed', wallet_balance, 'farmed')
+        wallet_confirmed_family = GaugeMetricFamily('chia_wallet_confirmed_mojos',
+                                                    'Confirmed balance of a wallet',
+                                                    labels=["id", "name", "type"])
+        wallet_spendable_family = GaugeMetricFamily('chia_wallet_spendable_mojos',
+                                                    'Spendable balance of a wallet',
+                                                    labels=["id", "name", "type"])
+        for wallet in wallets:
+            labels = [str(wallet.wallet_id), wallet.name or "", str(wallet.type)]
+            wallet_confirmed_family.add_metric(labels, wallet.confirmed)
+            wallet_spendable_family.add_metric(labels, wallet.spendable)
+        yield wallet_confirmed_family
+        yield wallet_spendable_family
+
+        # Full node metrics
+        yield gauge('chia_network_space', 'Approximation of current netspace', blockchain_state, 'space')
+        yield gauge('chia_diffculty', 'Current networks farming difficulty', blockchain_state, 'diffculty')
+        yield gauge('chia_peak_height', 'Block height of the current peak', blockchain_state, 'peak_height')
+        yield gauge('chia_sync_status', 'Sync status of the connected full node', blockchain_state, 'synced')
+        yield gauge('chia_mempool_size', 'Current mempool size', blockchain_state, 'mempool_size')
+        connections_family = GaugeMetricFamily('chia_connections_count',
+                                               'Count of peers that the node is currently connected to',
+                                               labels=["type"])
+        if connections is not None:
+            connections_family.add_metric(["Full Node"], connections.full_node_count)
+            connections_family.add_metric(["Farmer"], connections.farmer_count)
+            connections_family.add_metric(["Harvester"], connections.harvester_count)
+        yield connections_family
+
+        # Harvester metrics
+        plot_count_family = GaugeMetricFamily('chia_plot_count',
+                                              'Plot count being farmed by harvester',
+                                              labels=["host", "type"])
+        plot_size_family = GaugeMetricFamily('chia_plot_size',
+                                             'Size of plots being farmed by harvester',
+                                             labels=["host", "type"])
+        for harvester in harvesters:
+            plot_count_family.add_metric([harvester.host, "OG"], harvester.plot_count)
+            plot_count_family.add_metric([harvester.host, "portable"], harvester.portable_plot_count)
+            plot_size_family.add_metric([harvester.host, "OG"], harvester.plot_size)
+            plot_size_family.add_metric([harvester.host, "portable"], harvester.portable_plot_size)
+        yield plot_count_family
+        yield plot_size_family
+        plot_errors_family = GaugeMetricFamily('chia_plot_errors',
+                                               'Plots a harvester failed to open or has no key for',
+                                               labels=["host", "type"])
+        for harvester in harvesters:
+            if harvester.failed_plot_count is not None:
+                plot_errors_family.add_metric([harvester.host, "failed_to_open"], harvester.failed_plot_count)
+            if harvester.no_key_plot_count is not None:
+                plot_errors_family.add_metric([harvester.host, "no_key"], harvester.no_key_plot_count)
+        yield plot_errors_family
+
+        # Farmer metrics
+        yield CounterMetricFamily('chia_signage_points',
+                                  'Received signage points',
+                                  value=self.signage_points,
+                                  created=self.start_ts)
+        yield gauge('chia_signage_point_index', 'Received signage point index', self.last_signage_point,
+                    'signage_point_index')
+        yield CounterMetricFamily('chia_block_challenges',
+                                  'Attempted block challenges',
+                                  value=self.challenges,
+                                  created=self.start_ts)
+        yield CounterMetricFamily('chia_plots_passed_filter',
+                                  'Plots passed filter',
+                                  value=self.passed_filters,
+                                  created=self.start_ts)
+        yield CounterMetricFamily('chia_proofs_found', 'Proofs found', value=self.proofs_found, created=self.start_ts)
+        lookup_time_quantile_family = GaugeMetricFamily('chia_lookup_time_quantile_seconds',
+                                                        'Plot lookup time quantile over a sliding window',
+                                                        labels=["window", "quantile"])
+        lookup_time_max_family = GaugeMetricFamily('chia_lookup_time_max_seconds',
+                                                   'Maximum plot lookup time over a sliding window',
+                                                   labels=["window"])
+        for window in self.lookup_time_windows.windows:
+            sketch = window.snapshot()
+            if sketch.count == 0:
+                continue
+            label = format_window(window.window)
+            for quantile in LOOKUP_TIME_QUANTILES:
+                lookup_time_quantile_family.add_metric([label, str(quantile)], sketch.quantile(quantile))
+            lookup_time_max_family.add_metric([label], sketch.max)
+        yield lookup_time_quantile_family
+        yield lookup_time_max_family
+
+        # Pool metrics
+        for name, documentation, attribute in POOL_METRICS:
+            pool_family = GaugeMetricFamily(name, documentation, labels=['p2', 'url'])
+            for pool in pools:
+                pool_family.add_metric([pool.p2_singleton_puzzle_hash, pool.pool_url], getattr(pool, attribute))
+            yield pool_family
+
+        # Price metrics
+        yield gauge('chia_price_usd_cent', 'Current Chia price in USD cent', price, 'usd_cents')
+        yield gauge('chia_price_eur_cent', 'Current Chia price in EUR cent', price, 'eur_cents')
+        yield gauge('chia_price_btc_satoshi', 'Current Chia price in BTC satoshi', price, 'btc_satoshi')
+        yield gauge('chia_price_eth_gwei', 'Current Chia price in ETH gwei', price, 'eth_gwei')
+
+    def exposition(self, openmetrics: bool, compress: bool) -> Tuple[bytes, str]:
+        expired = monotonic() - self.cached_ts > self.cache_max_age_seconds
+        if self.cached_generation != self.generation or expired:
+            self.cached_generation = self.generation
+            self.cached_ts = monotonic()
+            self.cached_outputs = {}
+        variant = (openmetrics, compress)
+        if variant not in self.cached_outputs:
+            output = generate_latest_openmetrics(REGISTRY) if openmetrics else generate_latest(REGISTRY)
+            # Derived from the content, so it stays valid across restarts
+            etag = f'"{blake2b(output, digest_size=16).hexdigest()}-{int(openmetrics)}{int(compress)}"'
+            self.cached_outputs[variant] = (gzip.compress(output) if compress else output), etag
+        return self.cached_outputs[variant]
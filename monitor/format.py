@@ -25,6 +25,10 @@ def format_plot_size(plot_size: int) -> str:
     return f"🧺 Plot Size: {format_bytes(plot_size)}"
 
 
+def format_plot_errors(failed_plot_count: int, no_key_plot_count: int) -> str:
+    return f"⚠️ Plot Errors: {failed_plot_count} failed to open, {no_key_plot_count} without key"
+
+
 def format_plot_delta_24h(count_delta: int, size_delta: int) -> str:
     size_prefix = "+" if size_delta > 0 else "-"
     return f"🚜 Plot Change 24h: {count_delta:+} ({size_prefix}{format_bytes(abs(size_delta))})"
@@ -34,6 +38,10 @@ def format_balance(balance: int) -> str:
     return f"💰 Total Balance: {balance/1e12:.5f} XCH"
 
 
+def format_wallet_balance(name: str, balance: int) -> str:
+    return f"👛 Wallet {name}: {balance} mojos"
+
+
 def format_farmed(balance: int) -> str:
     return f"💸 Total Farmed: {balance/1e12:.5f} XCH"
 
@@ -140,3 +148,7 @@ def format_mempool_size(mempool_size: int) -> str:
 def format_lookup_time(lookup_time: int, fix_indent=False) -> str:
     indent = " " * (1 if fix_indent else 0)
     return f"⏱️ {indent}Lookup Time: {lookup_time * 1000:.2f}ms"
+
+
+def format_lookup_time_quantiles(window: str, p50: float, p95: float, p99: float, maximum: float) -> str:
+    return f"⏱️ Lookup Time {window}: p50 {p50:.2f}s, p95 {p95:.2f}s, p99 {p99:.2f}s, max {maximum:.2f}s"
@@ -1,14 +1,12 @@
 import logging
 
 from monitor.database.events import (BlockchainStateEvent, ChiaEvent, ConnectionsEvent, FarmingInfoEvent,
-                                     HarvesterPlotsEvent, PoolStateEvent, PriceEvent, SignagePointEvent, WalletBalanceEvent)
-from monitor.database.queries import get_signage_point_ts
+                                     HarvesterPlotsEvent, PoolStateEvent, PriceEvent, SignagePointEvent, WalletBalanceEvent,
+                                     WalletEvent)
 from monitor.format import *
 
 
 class ChiaLogger:
-    last_signage_point: SignagePointEvent = None
-
     def __init__(self) -> None:
         self.log = logging.getLogger(__name__)
 
@@ -23,6 +21,8 @@ class ChiaLogger:
             self.update_blockchain_state_metrics(event)
         elif isinstance(event, WalletBalanceEvent):
             self.update_wallet_balance_metrics(event)
+        elif isinstance(event, WalletEvent):
+            self.update_wallet_metrics(event)
         elif isinstance(event, SignagePointEvent):
             self.update_signage_point_metrics(event)
         elif isinstance(event, PoolStateEvent):
@@ -36,6 +36,8 @@ class ChiaLogger:
         self.log.info(format_portable_plot_count(event.portable_plot_count))
         self.log.info(format_og_plot_size(event.plot_size))
         self.log.info(format_portable_plot_size(event.portable_plot_size))
+        if event.failed_plot_count is not None and event.no_key_plot_count is not None:
+            self.log.info(format_plot_errors(event.failed_plot_count, event.no_key_plot_count))
         self.log.info(format_hostname(event.host, fix_indent=True))
 
     def update_farmer_metrics(self, event: FarmingInfoEvent):
@@ -45,15 +47,8 @@ class ChiaLogger:
         self.log.info(format_plot_count(event.total_plots))
         self.log.info(format_passed_filter(event.passed_filter))
         self.log.info(format_proofs(event.proofs))
-        self.log.info(format_proofs(event.proofs))
-        if self.last_signage_point is None:
-            return
-        if self.last_signage_point.signage_point == event.signage_point:
-            signage_point_ts = self.last_signage_point.ts
-        else:
-            signage_point_ts = get_signage_point_ts(event.signage_point)
-        lookup_time = event.ts - signage_point_ts
-        self.log.info(format_lookup_time(lookup_time.total_seconds(), fix_indent=True))
+        if event.lookup_time is not None:
+            self.log.info(format_lookup_time(event.lookup_time, fix_indent=True))
 
     def update_connection_metrics(self, event: ConnectionsEvent) -> None:
         self.log.info("-" * 64)
@@ -65,21 +60,23 @@ class ChiaLogger:
         self.log.info("-" * 64)
         self.log.info(format_space(int(event.space)))
         self.log.info(format_diffculty(event.diffculty))
-        self.log.info(format_peak_height(int(event.peak_height), fix_indent=True))
+        self.log.info(format_peak_height(event.peak_height, fix_indent=True))
         self.log.info(format_synced(event.synced))
         self.log.info(format_mempool_size(event.mempool_size))
 
     def update_wallet_balance_metrics(self, event: WalletBalanceEvent) -> None:
         self.log.info("-" * 64)
-        self.log.info(format_balance(int(event.confirmed)))
-        self.log.info(format_farmed(int(event.farmed)))
+        self.log.info(format_balance(event.confirmed))
+        self.log.info(format_farmed(event.farmed))
+
+    def update_wallet_metrics(self, event: WalletEvent) -> None:
+        self.log.info(format_wallet_balance(event.name, event.confirmed))
 
     def update_signage_point_metrics(self, event: SignagePointEvent) -> None:
         self.log.info("-" * 64)
         self.log.info(format_signage_point_index(event.signage_point_index))
         self.log.info(format_challenge_hash(event.challenge_hash))
         self.log.info(format_signage_point(event.signage_point))
-        self.last_signage_point = event
 
     def update_pool_state_metrics(self, event: PoolStateEvent) -> None:
         self.log.info("-" * 64)
@@ -1,25 +1,24 @@
 from apprise.Apprise import Apprise
-from monitor.database import session
-from monitor.database.queries import get_plot_count
 from monitor.format import *
 from monitor.notifications.notification import Notification
+from monitor.state import LatestState
 
 
 class LostPlotsNotification(Notification):
     last_plot_count: int
     highest_plot_count: int
     alert_threshold: int
+    state: LatestState
 
-    def __init__(self, apobj: Apprise, alert_threshold: int) -> None:
+    def __init__(self, apobj: Apprise, alert_threshold: int, state: LatestState) -> None:
         super().__init__(apobj)
+        self.state = state
         self.last_plot_count = None
         self.highest_plot_count = None
         self.alert_threshold = alert_threshold
 
     def condition(self) -> bool:
-        with session() as db_session:
-            self.last_plot_count = get_plot_count(db_session)
-
+        self.last_plot_count = self.state.get_plot_count()
         if self.last_plot_count is not None and self.highest_plot_count is not None and self.last_plot_count < self.highest_plot_count - self.alert_threshold:
             return True
         else:
@@ -1,14 +1,19 @@
-from monitor.database import session
-from monitor.database.queries import get_sync_status
+from apprise import Apprise
 from monitor.format import *
 from monitor.notifications.notification import Notification
+from monitor.state import LatestState
 
 
 class LostSyncNotification(Notification):
+    state: LatestState
+
+    def __init__(self, apobj: Apprise, state: LatestState) -> None:
+        super().__init__(apobj)
+        self.state = state
+
     def condition(self) -> bool:
-        with session() as db_session:
-            sync_status = get_sync_status(db_session)
-        return sync_status is not None and not sync_status
+        blockchain_state = self.state.get_blockchain_state()
+        return blockchain_state is not None and not blockchain_state.synced
 
     def trigger(self) -> None:
         return self.apobj.notify(
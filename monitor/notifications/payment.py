@@ -1,16 +1,23 @@
-from monitor.database import session
-from monitor.database.queries import get_current_balance, get_last_payment
+from apprise import Apprise
 from monitor.format import *
 from monitor.notifications.notification import Notification
+from monitor.state import LatestState
 
 
 class PaymentNotification(Notification):
     last_mojos: int = None
+    last_payment_mojos: int = None
+    state: LatestState
+
+    def __init__(self, apobj: Apprise, state: LatestState) -> None:
+        super().__init__(apobj)
+        self.state = state
 
     def condition(self) -> bool:
-        with session() as db_session:
-            current_mojos = get_current_balance(db_session)
+        wallet_balance = self.state.get_wallet_balance()
+        current_mojos = None if wallet_balance is None else wallet_balance.confirmed
         if current_mojos is not None and self.last_mojos is not None and current_mojos > self.last_mojos:
+            self.last_payment_mojos = current_mojos - self.last_mojos
             self.last_mojos = current_mojos
             return True
         else:
@@ -18,8 +25,6 @@ class PaymentNotification(Notification):
             return False
 
     def trigger(self) -> None:
-        with session() as db_session:
-            last_payment_mojos = get_last_payment(db_session)
         return self.apobj.notify(title='** 🤑 Payment received! 🤑 **',
                                  body="Your wallet received a new payment\n" + \
-                                     f"🌱 +{last_payment_mojos/1e12:.5f} XCH")
+                                     f"🌱 +{self.last_payment_mojos/1e12:.5f} XCH")
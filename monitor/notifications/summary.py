@@ -2,13 +2,12 @@ from datetime import datetime, timedelta
 
 from apprise import Apprise
 from monitor.database import session
-from monitor.database.queries import (get_blockchain_state, get_connections, get_farming_start,
-                                      get_og_plot_count, get_og_plot_size, get_passed_filters_per_minute,
-                                      get_plot_delta, get_portable_plot_count, get_portable_plot_size,
-                                      get_proofs_found, get_signage_points_per_minute,
-                                      get_wallet_balance)
+from monitor.database.queries import (get_farming_start, get_passed_filters_per_minute, get_plot_delta, get_proofs_found,
+                                      get_signage_points_per_minute)
 from monitor.format import *
 from monitor.notifications.notification import Notification
+from monitor.sketch import LookupTimeWindows, format_window
+from monitor.state import LatestState
 
 SECONDS_PER_BLOCK = (24 * 3600) / 4608
 
@@ -17,9 +16,14 @@ class SummaryNotification(Notification):
     summary_interval: timedelta
     startup_delay: timedelta
     last_summary_ts: datetime
+    lookup_time_windows: LookupTimeWindows
+    state: LatestState
 
-    def __init__(self, apobj: Apprise, summary_interval_minutes: int) -> None:
+    def __init__(self, apobj: Apprise, summary_interval_minutes: int, lookup_time_windows: LookupTimeWindows,
+                 state: LatestState) -> None:
         super().__init__(apobj)
+        self.lookup_time_windows = lookup_time_windows
+        self.state = state
         self.startup_delay = timedelta(seconds=30)
         self.summary_interval = timedelta(minutes=summary_interval_minutes)
         self.last_summary_ts: datetime = datetime.now() - self.summary_interval + self.startup_delay
@@ -31,16 +35,13 @@ class SummaryNotification(Notification):
             return False
 
     def trigger(self) -> None:
+        last_state = self.state.get_blockchain_state()
+        last_balance = self.state.get_wallet_balance()
+        last_connections = self.state.get_connections()
+        last_plots = self.state.get_plots()
         with session() as db_session:
-            last_state = get_blockchain_state(db_session)
-            last_balance = get_wallet_balance(db_session)
-            last_connections = get_connections(db_session)
             proofs_found = get_proofs_found(db_session)
             farming_start = get_farming_start(db_session)
-            last_og_plot_count = get_og_plot_count(db_session)
-            last_portable_plot_count = get_portable_plot_count(db_session)
-            last_og_plot_size = get_og_plot_size(db_session)
-            last_portable_plot_size = get_portable_plot_size(db_session)
             plot_count_delta, plot_size_delta = get_plot_delta(db_session)
 
             signage_points_per_min = None
@@ -53,11 +54,11 @@ class SummaryNotification(Notification):
                     passed_filters_per_min = get_passed_filters_per_minute(db_session, interval)
 
         if all(v is not None for v in [
-                last_og_plot_count, last_portable_plot_count, last_og_plot_size, last_portable_plot_size,
-                last_balance, last_state, last_connections, proofs_found, signage_points_per_min,
+                last_plots, last_balance, last_state, last_connections, proofs_found, signage_points_per_min,
                 passed_filters_per_min
         ]):
-            proportion = (last_og_plot_size + last_portable_plot_size) / int(last_state.space)
+            last_og_plot_count, last_portable_plot_count, last_og_plot_size, last_portable_plot_size = last_plots
+            proportion = (last_og_plot_size + last_portable_plot_size) / last_state.space
             try:
                 expected_minutes_to_win = int((SECONDS_PER_BLOCK / 60) / proportion)
             except ZeroDivisionError:
@@ -71,7 +72,7 @@ class SummaryNotification(Notification):
                 format_signage_points_per_min(signage_points_per_min),
                 format_passed_filter_per_min(passed_filters_per_min),
                 format_proofs(proofs_found),
-                format_balance(int(last_balance.confirmed)),
+                format_balance(last_balance.confirmed),
                 format_expected_time_to_win(expected_minutes_to_win),
                 format_space(int(last_state.space)),
                 format_peak_height(last_state.peak_height),
@@ -79,6 +80,12 @@ class SummaryNotification(Notification):
                 format_full_node_count(last_connections.full_node_count),
                 format_synced(last_state.synced),
             ])
+            lookup_time_window = self.lookup_time_windows.closest(self.summary_interval)
+            lookup_times = lookup_time_window.snapshot()
+            if lookup_times.count > 0:
+                summary += "\n" + format_lookup_time_quantiles(format_window(lookup_time_window.window),
+                                                               lookup_times.quantile(0.5), lookup_times.quantile(0.95),
+                                                               lookup_times.quantile(0.99), lookup_times.max)
             sent = self.apobj.notify(title='** 👨‍🌾 Farm Status 👩‍🌾 **', body=summary)
             if sent:
                 self.last_summary_ts = datetime.now()
@@ -1,12 +1,15 @@
 import logging
 from threading import Thread
-from time import sleep
+from time import perf_counter, sleep
 
 from apprise import Apprise, AppriseAsset
 from sqlalchemy.exc import OperationalError
 
+from monitor.exporter import ChiaExporter
 from monitor.notifications import (FoundProofNotification, LostPlotsNotification, LostSyncNotification,
                                    PaymentNotification, SummaryNotification)
+from monitor.sketch import LookupTimeWindows
+from monitor.state import LatestState
 
 
 class Notifier:
@@ -16,18 +19,18 @@ class Notifier:
     refresh_interval: int
     stopped = False
 
-    def __init__(self, status_url: str, alert_url: str, status_interval_minutes: int,
-                 lost_plots_alert_threshold: int, disable_proof_found_alert: bool,
-                 refresh_interval_seconds: int) -> None:
+    def __init__(self, status_url: str, alert_url: str, status_interval_minutes: int, lost_plots_alert_threshold: int,
+                 disable_proof_found_alert: bool, refresh_interval_seconds: int, lookup_time_windows: LookupTimeWindows,
+                 state: LatestState) -> None:
         self.log = logging.getLogger(__name__)
         self.status_apobj.add(status_url)
         self.alert_apobj.add(alert_url)
         self.refresh_interval = refresh_interval_seconds
         self.notifications = [
-            LostSyncNotification(self.alert_apobj),
-            LostPlotsNotification(self.alert_apobj, lost_plots_alert_threshold),
-            PaymentNotification(self.alert_apobj),
-            SummaryNotification(self.status_apobj, status_interval_minutes),
+            LostSyncNotification(self.alert_apobj, state),
+            LostPlotsNotification(self.alert_apobj, lost_plots_alert_threshold, state),
+            PaymentNotification(self.alert_apobj, state),
+            SummaryNotification(self.status_apobj, status_interval_minutes, lookup_time_windows, state),
         ]
         if not disable_proof_found_alert:
             self.notifications.append(FoundProofNotification(self.status_apobj))
@@ -36,7 +39,10 @@ class Notifier:
         while True:
             try:
                 for notification in self.notifications:
+                    start = perf_counter()
                     notification.run()
+                    elapsed = perf_counter() - start
+                    ChiaExporter.notification_time.labels(type(notification).__name__).observe(elapsed)
                 sleep(self.refresh_interval)
             except OperationalError:
                 logging.exception(
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from asyncio import Queue
+from collections import deque
+from enum import Enum
+from time import perf_counter
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, Type
+
+from monitor.database import ChiaEvent
+from monitor.database.events import (BlockchainStateEvent, ConnectionsEvent, HarvesterPlotsEvent, PoolStateEvent, PriceEvent,
+                                     WalletBalanceEvent, WalletEvent)
+from monitor.exporter import ChiaExporter
+
+SNAPSHOT_KEYS: Dict[Type[ChiaEvent], Callable[[ChiaEvent], Hashable]] = {
+    HarvesterPlotsEvent: lambda event: event.host,
+    ConnectionsEvent: lambda _: None,
+    BlockchainStateEvent: lambda _: None,
+    WalletBalanceEvent: lambda _: None,
+    WalletEvent: lambda event: event.wallet_id,
+    PoolStateEvent: lambda event: event.p2_singleton_puzzle_hash,
+    PriceEvent: lambda _: None,
+}
+
+
+def snapshot_key(event: ChiaEvent) -> Optional[Tuple[Type[ChiaEvent], Hashable]]:
+    key_func = SNAPSHOT_KEYS.get(type(event))
+    if key_func is None:
+        return None
+    return type(event), key_func(event)
+
+
+def snapshot_values(event: ChiaEvent) -> Tuple:
+    return tuple(getattr(event, column.key) for column in event.__table__.columns if column.key not in ["id", "ts"])
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+
+
+class SinkQueue(Queue):
+    not_full: asyncio.Event
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = deque()
+        self.not_full = asyncio.Event()
+
+    def _get(self) -> ChiaEvent:
+        self.not_full.set()
+        return self._queue.popleft()
+
+    def drop_oldest(self) -> None:
+        self._get()
+
+    async def wait_until_not_full(self) -> None:
+        while self.full():
+            self.not_full.clear()
+            await self.not_full.wait()
+
+
+class CoalescingQueue(SinkQueue):
+    # Snapshot events are queued by key, so a newer snapshot replaces the pending one in place
+    name: str
+    snapshots: Dict[Tuple[Type[ChiaEvent], Hashable], ChiaEvent]
+
+    def __init__(self, name: str, maxsize: int = 0) -> None:
+        self.name = name
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+        self.snapshots = {}
+
+    async def put(self, event: ChiaEvent) -> None:
+        # Replacing a pending snapshot takes no room, so it never waits for a full queue
+        if not self.replace(event):
+            await super().put(event)
+
+    def replace(self, event: ChiaEvent) -> bool:
+        key = snapshot_key(event)
+        if key is None or key not in self.snapshots:
+            return False
+        self.snapshots[key] = event
+        ChiaExporter.coalesced_counter.labels(self.name).inc()
+        return True
+
+    def _put(self, event: ChiaEvent) -> None:
+        if self.replace(event):
+            return
+        key = snapshot_key(event)
+        if key is None:
+            self._queue.append(event)
+        else:
+            self.snapshots[key] = event
+            self._queue.append(key)
+
+    def _get(self) -> ChiaEvent:
+        item = super()._get()
+        if isinstance(item, tuple):
+            return self.snapshots.pop(item)
+        return item
+
+
+class Sink:
+    name: str
+    handler: Callable[[ChiaEvent], None]
+    policy: OverflowPolicy
+    queue: SinkQueue
+
+    def __init__(self, name: str, handler: Callable[[ChiaEvent], None], queue_size: int, policy: OverflowPolicy) -> None:
+        self.log = logging.getLogger(__name__)
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        if policy is OverflowPolicy.COALESCE:
+            self.queue = CoalescingQueue(name, queue_size)
+        else:
+            self.queue = SinkQueue(queue_size)
+        ChiaExporter.sink_queue_size_gauge.labels(name).set_function(self.queue.qsize)
+
+    def put_nowait(self, event: ChiaEvent) -> None:
+        if self.policy is OverflowPolicy.DROP_OLDEST and self.queue.full():
+            self.queue.drop_oldest()
+            ChiaExporter.sink_dropped_counter.labels(self.name).inc()
+            self.log.debug(f"{self.name} sink is falling behind. Dropped oldest pending event")
+        elif self.policy is OverflowPolicy.COALESCE and self.queue.replace(event):
+            return
+        self.queue.put_nowait(event)
+
+    async def wait_for_room(self) -> None:
+        # Only dropping the oldest event makes room without waiting for the sink to catch up
+        if self.policy is not OverflowPolicy.DROP_OLDEST:
+            await self.queue.wait_until_not_full()
+
+    async def task(self) -> None:
+        while True:
+            event = await self.queue.get()
+            start = perf_counter()
+            self.handler(event)
+            ChiaExporter.sink_processing_time.labels(self.name).observe(perf_counter() - start)
+
+
+class Pipeline:
+    event_queue: Queue[ChiaEvent]
+    stages: List[Callable[[ChiaEvent], None]]
+    sinks: List[Sink]
+
+    def __init__(self, event_queue: Queue[ChiaEvent], stages: List[Callable[[ChiaEvent], None]], sinks: List[Sink]) -> None:
+        self.event_queue = event_queue
+        self.stages = stages
+        self.sinks = sinks
+        ChiaExporter.event_queue_size_gauge.set_function(event_queue.qsize)
+
+    async def dispatch(self) -> None:
+        while True:
+            # A sink that is behind holds back the next event, so every sink gets each event at the same time and
+            # the back-pressure builds up in the bounded event queue of the collectors
+            for sink in self.sinks:
+                await sink.wait_for_room()
+            event = await self.event_queue.get()
+            ChiaExporter.events_counter.labels(type(event).__name__).inc()
+            for stage in self.stages:
+                stage(event)
+            for sink in self.sinks:
+                sink.put_nowait(event)
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self.dispatch())] + [asyncio.create_task(sink.task()) for sink in self.sinks]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
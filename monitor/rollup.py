@@ -0,0 +1,253 @@
+import logging
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Type
+
+from sqlalchemy import BigInteger
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement, and_, delete, select, type_coerce
+from sqlalchemy.sql.functions import func
+
+from monitor.database import ChiaEvent, session
+from monitor.database.events import (HOUR_RESOLUTION, MINUTE_RESOLUTION, FarmingInfoEvent, FarmingRollup, RollupWatermark,
+                                     SignagePointEvent)
+from monitor.database.queries import get_rollup_end, get_rollup_start, get_rollup_watermark, invalidate_queries
+from monitor.database.types import datetime_to_millis, millis_to_datetime
+from monitor.exporter import ChiaExporter
+
+# Events are written in batches, so a period is only rolled up once it ended this long ago. Events written even
+# later are merged into the existing rollups on the next run.
+SETTLE_DELAY = timedelta(minutes=1)
+# Each chunk is committed separately to keep the DB writer from waiting on a long transaction
+ROLLUP_CHUNK = timedelta(days=1)
+PRUNE_CHUNK_SIZE = 10000
+RAW_MODELS: List[Type[ChiaEvent]] = [FarmingInfoEvent, SignagePointEvent]
+
+
+def bucket(ts: ColumnElement, resolution: int) -> ColumnElement:
+    ts_ms = type_coerce(ts, BigInteger)
+    return (ts_ms - ts_ms % (resolution * 1000)).label("bucket")
+
+
+def floor_ts(ts: datetime, resolution: int) -> datetime:
+    ts_ms = datetime_to_millis(ts)
+    return millis_to_datetime(ts_ms - ts_ms % (resolution * 1000))
+
+
+def empty_rollup(bucket_ms: int, resolution: int) -> FarmingRollup:
+    return FarmingRollup(ts=millis_to_datetime(bucket_ms),
+                         resolution=resolution,
+                         signage_points=0,
+                         farming_infos=0,
+                         passed_filter=0,
+                         proofs=0,
+                         lookup_time_count=0,
+                         lookup_time_sum=0.0,
+                         lookup_time_max=None)
+
+
+def rollup_events(db_session: Session, where: Callable[[Type[ChiaEvent]], ColumnElement]) -> List[FarmingRollup]:
+    rollups: Dict[int, FarmingRollup] = {}
+    farming_info_bucket = bucket(FarmingInfoEvent.ts, MINUTE_RESOLUTION)
+    result = db_session.execute(
+        select(farming_info_bucket, func.count(),
+               func.sum(FarmingInfoEvent.passed_filter), func.sum(FarmingInfoEvent.proofs),
+               func.count(FarmingInfoEvent.lookup_time), func.sum(FarmingInfoEvent.lookup_time),
+               func.max(FarmingInfoEvent.lookup_time)).where(where(FarmingInfoEvent)).group_by(farming_info_bucket))
+    for bucket_ms, farming_infos, passed_filter, proofs, lookup_time_count, lookup_time_sum, lookup_time_max in result:
+        rollup = rollups[bucket_ms] = empty_rollup(bucket_ms, MINUTE_RESOLUTION)
+        rollup.farming_infos = farming_infos
+        rollup.passed_filter = passed_filter or 0
+        rollup.proofs = proofs or 0
+        rollup.lookup_time_count = lookup_time_count
+        rollup.lookup_time_sum = lookup_time_sum or 0.0
+        rollup.lookup_time_max = lookup_time_max
+    signage_point_bucket = bucket(SignagePointEvent.ts, MINUTE_RESOLUTION)
+    result = db_session.execute(
+        select(signage_point_bucket, func.count()).where(where(SignagePointEvent)).group_by(signage_point_bucket))
+    for bucket_ms, signage_points in result:
+        if bucket_ms not in rollups:
+            rollups[bucket_ms] = empty_rollup(bucket_ms, MINUTE_RESOLUTION)
+        rollups[bucket_ms].signage_points = signage_points
+    return list(rollups.values())
+
+
+def merge_rollup(db_session: Session, delta: FarmingRollup, resolution: int) -> None:
+    ts = floor_ts(delta.ts, resolution)
+    rollup = db_session.execute(select(FarmingRollup).where(FarmingRollup.resolution == resolution,
+                                                            FarmingRollup.ts == ts)).scalars().first()
+    if rollup is None:
+        rollup = empty_rollup(datetime_to_millis(ts), resolution)
+        db_session.add(rollup)
+    rollup.signage_points += delta.signage_points
+    rollup.farming_infos += delta.farming_infos
+    rollup.passed_filter += delta.passed_filter
+    rollup.proofs += delta.proofs
+    rollup.lookup_time_count += delta.lookup_time_count
+    rollup.lookup_time_sum += delta.lookup_time_sum
+    lookup_time_max = [value for value in [rollup.lookup_time_max, delta.lookup_time_max] if value is not None]
+    rollup.lookup_time_max = max(lookup_time_max) if len(lookup_time_max) > 0 else None
+
+
+def merge_late_events(db_session: Session, raw_end: datetime, watermarks: Dict[Type[ChiaEvent], int],
+                      last_ids: Dict[Type[ChiaEvent], int]) -> None:
+    late_rollups = rollup_events(
+        db_session, lambda model: and_(model.ts < raw_end, model.id > watermarks[model], model.id <= last_ids[model]))
+    if len(late_rollups) == 0:
+        return
+    minute_start = get_rollup_start(db_session, MINUTE_RESOLUTION)
+    hour_end = get_rollup_end(db_session, HOUR_RESOLUTION)
+    # Minutes older than the remaining minute rollups are only counted in their hour rollup
+    minute_floor = hour_end if minute_start is None else floor_ts(minute_start, HOUR_RESOLUTION)
+    for late_rollup in late_rollups:
+        if minute_floor is None or late_rollup.ts >= minute_floor:
+            merge_rollup(db_session, late_rollup, MINUTE_RESOLUTION)
+        if hour_end is not None and late_rollup.ts < hour_end:
+            merge_rollup(db_session, late_rollup, HOUR_RESOLUTION)
+    ChiaExporter.late_rows_counter.labels(FarmingInfoEvent.__tablename__).inc(
+        sum(late_rollup.farming_infos for late_rollup in late_rollups))
+    ChiaExporter.late_rows_counter.labels(SignagePointEvent.__tablename__).inc(
+        sum(late_rollup.signage_points for late_rollup in late_rollups))
+
+
+def rollup_raw_events(db_session: Session, start: datetime, end: datetime) -> None:
+    # Ids only grow, since all events are inserted by the DB writer. Every row up to the watermark with a ts
+    # before the end of the rollups is part of them, so the rows above it are either newer or late.
+    last_ids = {}
+    watermarks = {}
+    for model in RAW_MODELS:
+        last_ids[model] = db_session.execute(select(func.max(model.id))).scalars().first() or 0
+        watermarks[model] = get_rollup_watermark(db_session, model) or 0
+    merge_late_events(db_session, start, watermarks, last_ids)
+    db_session.add_all(
+        rollup_events(db_session, lambda model: and_(model.ts >= start, model.ts < end, model.id <= last_ids[model])))
+    for model in RAW_MODELS:
+        watermark = db_session.get(RollupWatermark, model.__tablename__)
+        if watermark is None:
+            db_session.add(RollupWatermark(table_name=model.__tablename__, last_id=last_ids[model]))
+        else:
+            watermark.last_id = last_ids[model]
+
+
+def rollup_minutes(db_session: Session, start: datetime, end: datetime) -> List[FarmingRollup]:
+    hour_bucket = bucket(FarmingRollup.ts, HOUR_RESOLUTION)
+    minutes = and_(FarmingRollup.resolution == MINUTE_RESOLUTION, FarmingRollup.ts >= start, FarmingRollup.ts < end)
+    result = db_session.execute(
+        select(hour_bucket, func.sum(FarmingRollup.signage_points), func.sum(FarmingRollup.farming_infos),
+               func.sum(FarmingRollup.passed_filter), func.sum(FarmingRollup.proofs),
+               func.sum(FarmingRollup.lookup_time_count), func.sum(FarmingRollup.lookup_time_sum),
+               func.max(FarmingRollup.lookup_time_max)).where(minutes).group_by(hour_bucket))
+    return [
+        FarmingRollup(ts=millis_to_datetime(bucket_ms),
+                      resolution=HOUR_RESOLUTION,
+                      signage_points=signage_points,
+                      farming_infos=farming_infos,
+                      passed_filter=passed_filter,
+                      proofs=proofs,
+                      lookup_time_count=lookup_time_count,
+                      lookup_time_sum=lookup_time_sum,
+                      lookup_time_max=lookup_time_max) for bucket_ms, signage_points, farming_infos, passed_filter, proofs,
+        lookup_time_count, lookup_time_sum, lookup_time_max in result
+    ]
+
+
+class RollupJob:
+    interval: int
+    raw_retention: Optional[timedelta]
+    minute_retention: Optional[timedelta]
+
+    def __init__(self, interval_seconds: int, raw_retention_days: Optional[int],
+                 minute_retention_days: Optional[int]) -> None:
+        self.log = logging.getLogger(__name__)
+        self.interval = interval_seconds
+        self.raw_retention = None if raw_retention_days is None else timedelta(days=raw_retention_days)
+        self.minute_retention = None if minute_retention_days is None else timedelta(days=minute_retention_days)
+        self.stopped = Event()
+        self.thread = None
+
+    @staticmethod
+    def get_first_ts(db_session: Session, resolution: int) -> Optional[datetime]:
+        if resolution == HOUR_RESOLUTION:
+            return get_rollup_start(db_session, MINUTE_RESOLUTION)
+        first_ts = [
+            db_session.execute(select(func.min(FarmingInfoEvent.ts))).scalars().first(),
+            db_session.execute(select(func.min(SignagePointEvent.ts))).scalars().first(),
+        ]
+        first_ts = [ts for ts in first_ts if ts is not None]
+        return min(first_ts) if len(first_ts) > 0 else None
+
+    def rollup(self, resolution: int) -> None:
+        with session() as db_session:
+            # Raw events are only rolled up after the newest rollup, even if it is an hour rollup
+            start = get_rollup_end(db_session, None if resolution == MINUTE_RESOLUTION else resolution)
+            if start is None:
+                start = RollupJob.get_first_ts(db_session, resolution)
+        if start is None:
+            return
+        start = floor_ts(start, resolution)
+        end = max(floor_ts(datetime.now() - SETTLE_DELAY, resolution), start)
+        while True:
+            chunk_end = min(start + ROLLUP_CHUNK, end)
+            with session.begin() as db_session:
+                if resolution == MINUTE_RESOLUTION:
+                    # Also runs without a new period to merge the late events
+                    rollup_raw_events(db_session, start, chunk_end)
+                elif start < chunk_end:
+                    db_session.add_all(rollup_minutes(db_session, start, chunk_end))
+            invalidate_queries([FarmingRollup])
+            start = chunk_end
+            if start >= end:
+                break
+
+    def prune(self, model: Type[ChiaEvent], cutoff: datetime, *criteria: ColumnElement) -> None:
+        while True:
+            with session.begin() as db_session:
+                ids = select(model.id).where(model.ts < cutoff, *criteria).limit(PRUNE_CHUNK_SIZE)
+                result = db_session.execute(
+                    delete(model).where(model.id.in_(ids.scalar_subquery())).execution_options(synchronize_session=False))
+            invalidate_queries([model])
+            ChiaExporter.pruned_rows_counter.labels(model.__tablename__).inc(result.rowcount)
+            if result.rowcount < PRUNE_CHUNK_SIZE:
+                break
+
+    def prune_expired(self) -> None:
+        with session() as db_session:
+            minute_end = get_rollup_end(db_session)
+            hour_end = get_rollup_end(db_session, HOUR_RESOLUTION)
+            watermarks = {model: get_rollup_watermark(db_session, model) for model in RAW_MODELS}
+        # Only rows that are already part of a coarser rollup are pruned
+        if self.raw_retention is not None and minute_end is not None:
+            cutoff = min(datetime.now() - self.raw_retention, minute_end)
+            for model in RAW_MODELS:
+                # The row at the watermark is kept, so that new ids keep growing past it even on SQLite
+                if watermarks[model] is not None:
+                    self.prune(model, cutoff, model.id < watermarks[model])
+        if self.minute_retention is not None and hour_end is not None:
+            cutoff = floor_ts(min(datetime.now() - self.minute_retention, hour_end), HOUR_RESOLUTION)
+            self.prune(FarmingRollup, cutoff, FarmingRollup.resolution == MINUTE_RESOLUTION)
+
+    def run(self) -> None:
+        start = perf_counter()
+        self.rollup(MINUTE_RESOLUTION)
+        self.rollup(HOUR_RESOLUTION)
+        self.prune_expired()
+        ChiaExporter.rollup_time.observe(perf_counter() - start)
+
+    def task(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.run()
+            except OperationalError as e:
+                self.log.warning(f"Failed to roll up farming events. Trying again... {type(e).__name__}: {e}")
+            self.stopped.wait(self.interval)
+
+    def start(self) -> None:
+        self.thread = Thread(target=self.task, name="rollup")
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,46 @@
+from time import monotonic
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST as CONTENT_TYPE_OPENMETRICS
+
+from monitor.exporter import ChiaExporter
+
+
+class HttpServer:
+    exporter: ChiaExporter
+    port: int
+    app: web.Application
+    runner: web.AppRunner
+
+    def __init__(self, exporter: ChiaExporter, port: int) -> None:
+        self.exporter = exporter
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self.metrics)
+        self.app.router.add_get("/health", self.health)
+
+    async def start(self) -> None:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, port=self.port).start()
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        openmetrics = "application/openmetrics-text" in request.headers.get("Accept", "")
+        compress = "gzip" in request.headers.get("Accept-Encoding", "")
+        output, etag = self.exporter.exposition(openmetrics, compress)
+        headers = {"ETag": etag, "Vary": "Accept, Accept-Encoding"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Type"] = CONTENT_TYPE_OPENMETRICS if openmetrics else CONTENT_TYPE_LATEST
+        return web.Response(body=output, headers=headers)
+
+    async def health(self, _request: web.Request) -> web.Response:
+        last_event_ts = self.exporter.last_event_ts
+        last_event_age = None if last_event_ts is None else round(monotonic() - last_event_ts, 3)
+        return web.json_response({"status": "ok", "last_event_age_seconds": last_event_age})
+
+    async def close(self) -> None:
+        await self.runner.cleanup()
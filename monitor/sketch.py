@@ -0,0 +1,99 @@
+import math
+from collections import defaultdict, deque
+from datetime import timedelta
+from threading import Lock
+from time import monotonic
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class DDSketch:
+    # Buckets grow geometrically, so every quantile is within relative_accuracy of the exact value
+    gamma: float
+    min_value: float
+    buckets: Dict[int, int]
+    count: int
+    max: float
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        key = math.ceil(math.log(max(value, self.min_value)) / self.log_gamma)
+        self.buckets[key] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch") -> None:
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return min(2 * self.gamma**key / (self.gamma + 1), self.max)
+        return self.max
+
+
+class SlidingWindowSketch:
+    # The window is split into slots, so expired values are dropped a whole slot at a time
+    window: timedelta
+    slot_seconds: float
+    slots: Deque[Tuple[int, DDSketch]]
+
+    def __init__(self, window: timedelta, num_slots: int = 12) -> None:
+        self.window = window
+        self.slot_seconds = window.total_seconds() / num_slots
+        self.num_slots = num_slots
+        self.slots = deque()
+        self.lock = Lock()
+
+    def expire(self, slot: int) -> None:
+        while len(self.slots) > 0 and self.slots[0][0] <= slot - self.num_slots:
+            self.slots.popleft()
+
+    def add(self, value: float) -> None:
+        slot = int(monotonic() // self.slot_seconds)
+        with self.lock:
+            self.expire(slot)
+            if len(self.slots) == 0 or self.slots[-1][0] != slot:
+                self.slots.append((slot, DDSketch()))
+            self.slots[-1][1].add(value)
+
+    def snapshot(self) -> DDSketch:
+        sketch = DDSketch()
+        with self.lock:
+            self.expire(int(monotonic() // self.slot_seconds))
+            for _, slot_sketch in self.slots:
+                sketch.merge(slot_sketch)
+        return sketch
+
+
+def format_window(window: timedelta) -> str:
+    minutes = int(window.total_seconds() // 60)
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+class LookupTimeWindows:
+    windows: List[SlidingWindowSketch]
+
+    def __init__(self, window_minutes: List[int]) -> None:
+        self.windows = [SlidingWindowSketch(timedelta(minutes=minutes)) for minutes in sorted(window_minutes)]
+
+    def add(self, lookup_time: float) -> None:
+        for window in self.windows:
+            window.add(lookup_time)
+
+    def closest(self, interval: timedelta) -> SlidingWindowSketch:
+        return min(self.windows, key=lambda window: abs(window.window - interval))
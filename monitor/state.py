@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Hashable, List, Optional, Set, Tuple, Type, TypeVar
+
+from sqlalchemy.orm import Session
+
+from monitor.database import ChiaEvent, queries
+from monitor.database.events import (BlockchainStateEvent, ConnectionsEvent, HarvesterPlotsEvent, PoolStateEvent, PriceEvent,
+                                     WalletBalanceEvent, WalletEvent)
+from monitor.pipeline import snapshot_key
+
+Event = TypeVar("Event", bound=ChiaEvent)
+
+
+class LatestState:
+    # Newest snapshot per type and key, fed by the pipeline and read by the notifier thread
+    events: Dict[Tuple[Type[ChiaEvent], Hashable], ChiaEvent]
+    # Keys of snapshots loaded from the DB that were not published by the pipeline since
+    loaded: Set[Tuple[Type[ChiaEvent], Hashable]]
+    max_age: timedelta
+    lock: Lock
+
+    def __init__(self, poll_interval_seconds: float) -> None:
+        self.events = {}
+        self.loaded = set()
+        # Published snapshots are refreshed on every poll, even when unchanged
+        self.max_age = timedelta(seconds=poll_interval_seconds)
+        self.lock = Lock()
+
+    def process_event(self, event: ChiaEvent) -> None:
+        key = snapshot_key(event)
+        if key is not None:
+            with self.lock:
+                self.events[key] = event
+                self.loaded.discard(key)
+
+    def load(self, db_session: Session) -> None:
+        latest_events = queries.get_plot_snapshots(db_session) + queries.get_latest_pool_states(db_session)
+        latest_events += queries.get_latest_wallets(db_session)
+        latest_events += [
+            queries.get_blockchain_state(db_session),
+            queries.get_wallet_balance(db_session),
+            queries.get_connections(db_session),
+            queries.get_price(db_session),
+        ]
+        with self.lock:
+            for event in latest_events:
+                if event is not None and snapshot_key(event) not in self.events:
+                    self.events[snapshot_key(event)] = event
+                    self.loaded.add(snapshot_key(event))
+
+    def get(self, event_type: Type[Event], key: Hashable = None) -> Optional[Event]:
+        with self.lock:
+            return self.events.get((event_type, key))
+
+    def get_recent(self, event_type: Type[Event]) -> List[Event]:
+        now = datetime.now()
+        with self.lock:
+            return [
+                event for key, event in self.events.items()
+                if key[0] is event_type and event.ts > now - self.get_max_age(key)
+            ]
+
+    def get_max_age(self, key: Tuple[Type[ChiaEvent], Hashable]) -> timedelta:
+        # Unchanged snapshots are only stored once per heartbeat, so loaded ones can be that old
+        return queries.snapshot_max_age if key in self.loaded else self.max_age
+
+    def get_blockchain_state(self) -> Optional[BlockchainStateEvent]:
+        return self.get(BlockchainStateEvent)
+
+    def get_wallet_balance(self) -> Optional[WalletBalanceEvent]:
+        return self.get(WalletBalanceEvent)
+
+    def get_connections(self) -> Optional[ConnectionsEvent]:
+        return self.get(ConnectionsEvent)
+
+    def get_price(self) -> Optional[PriceEvent]:
+        return self.get(PriceEvent)
+
+    def get_harvesters(self) -> List[HarvesterPlotsEvent]:
+        return self.get_recent(HarvesterPlotsEvent)
+
+    def get_pools(self) -> List[PoolStateEvent]:
+        return self.get_recent(PoolStateEvent)
+
+    def get_wallets(self) -> List[WalletEvent]:
+        return self.get_recent(WalletEvent)
+
+    def get_plots(self) -> Optional[Tuple[int, int, int, int]]:
+        return queries.sum_plots(self.get_harvesters())
+
+    def get_plot_count(self) -> Optional[int]:
+        plots = self.get_plots()
+        return None if plots is None else plots[0] + plots[1]
@@ -0,0 +1,55 @@
+import json
+import logging
+from typing import List
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import delete
+
+from monitor.database import ChiaEvent, configure_engine, session
+from monitor.database.events import FARMING_TOTALS_ID, FarmingInfoEvent, FarmingTotals, SignagePointEvent
+from monitor.database.queries import (count_farming_infos, count_passed_filters, count_proofs_found, count_signage_points,
+                                      find_farming_start, get_farming_totals)
+
+
+def compute_farming_totals(db_session: Session) -> FarmingTotals:
+    return FarmingTotals(id=FARMING_TOTALS_ID,
+                         farming_start=find_farming_start(db_session),
+                         signage_points=count_signage_points(db_session) or 0,
+                         farming_infos=count_farming_infos(db_session) or 0,
+                         passed_filter=count_passed_filters(db_session) or 0,
+                         proofs=count_proofs_found(db_session) or 0)
+
+
+def update_farming_totals(db_session: Session, batch: List[ChiaEvent]) -> None:
+    totals = get_farming_totals(db_session)
+    if totals is None:
+        # Events stored before the totals existed are counted once, before the batch is added
+        totals = compute_farming_totals(db_session)
+        db_session.add(totals)
+    for event in batch:
+        if isinstance(event, SignagePointEvent):
+            totals.signage_points += 1
+        elif isinstance(event, FarmingInfoEvent):
+            if totals.farming_start is None:
+                totals.farming_start = event.ts
+            totals.farming_infos += 1
+            totals.passed_filter += event.passed_filter or 0
+            totals.proofs += event.proofs or 0
+
+
+def rebuild_farming_totals() -> FarmingTotals:
+    with session.begin() as db_session:
+        db_session.execute(delete(FarmingTotals))
+        totals = compute_farming_totals(db_session)
+        db_session.add(totals)
+    return totals
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with open("config.json") as f:
+        config = json.load(f)
+    configure_engine(config["database"]["url"], config["database"]["pool_size"], config["database"]["sqlite_pragmas"])
+    totals = rebuild_farming_totals()
+    logging.info(f"🧮 Rebuilt farming totals: {totals.signage_points} signage points, "
+                 f"{totals.passed_filter} passed filters and {totals.proofs} proofs since {totals.farming_start}")
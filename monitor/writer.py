@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import perf_counter
+from typing import Dict, Hashable, List, Tuple, Type
+
+from sqlalchemy.exc import OperationalError
+
+from monitor.database import ChiaEvent, session
+from monitor.database.queries import invalidate_queries
+from monitor.exporter import ChiaExporter
+from monitor.pipeline import OverflowPolicy, Sink, snapshot_key, snapshot_values
+from monitor.totals import update_farming_totals
+
+
+class DatabaseWriter(Sink):
+    batch_size: int
+    flush_interval: float
+    pending: List[ChiaEvent]
+    heartbeat_interval: timedelta
+    # Last stored snapshot per key, unchanged snapshots are only stored once per heartbeat interval
+    stored_snapshots: Dict[Tuple[Type[ChiaEvent], Hashable], ChiaEvent]
+
+    def __init__(self, queue_size: int, policy: OverflowPolicy, batch_size: int, flush_interval_seconds: float,
+                 heartbeat_interval_seconds: int) -> None:
+        super().__init__("database", None, queue_size, policy)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_seconds
+        self.heartbeat_interval = timedelta(seconds=heartbeat_interval_seconds)
+        self.pending = []
+        self.stored_snapshots = {}
+        # A single worker thread keeps commits ordered and off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    def should_store(self, event: ChiaEvent) -> bool:
+        key = snapshot_key(event)
+        if key is None:
+            return True
+        stored = self.stored_snapshots.get(key)
+        if (stored is not None and event.ts - stored.ts < self.heartbeat_interval
+                and snapshot_values(event) == snapshot_values(stored)):
+            return False
+        self.stored_snapshots[key] = event
+        return True
+
+    def put_nowait(self, event: ChiaEvent) -> None:
+        if not self.should_store(event):
+            ChiaExporter.unchanged_snapshots_counter.labels(type(event).__name__).inc()
+            return
+        super().put_nowait(event)
+
+    @staticmethod
+    def commit(batch: List[ChiaEvent]) -> None:
+        with session.begin() as db_session:
+            update_farming_totals(db_session, batch)
+            db_session.add_all(batch)
+            models = {type(instance) for instance in db_session.new | db_session.dirty}
+        invalidate_queries(models)
+
+    async def flush(self, batch: List[ChiaEvent]) -> None:
+        if len(batch) == 0:
+            return
+        start = perf_counter()
+        await asyncio.get_running_loop().run_in_executor(self.executor, DatabaseWriter.commit, batch)
+        ChiaExporter.db_flush_time.observe(perf_counter() - start)
+        ChiaExporter.db_batch_size.observe(len(batch))
+
+    def drain(self, limit: int) -> None:
+        while len(self.pending) < limit and not self.queue.empty():
+            self.pending.append(self.queue.get_nowait())
+
+    async def task(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self.pending.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            self.drain(self.batch_size)
+            while len(self.pending) < self.batch_size and loop.time() < deadline:
+                try:
+                    self.pending.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                self.drain(self.batch_size)
+            batch, self.pending = self.pending, []
+            await self.flush(batch)
+
+    async def close(self) -> None:
+        self.drain(len(self.pending) + self.queue.qsize())
+        batch, self.pending = self.pending, []
+        try:
+            await self.flush(batch)
+        except OperationalError:
+            self.log.exception("Failed to persist remaining events to DB")
+        self.executor.shutdown()